@@ -0,0 +1,115 @@
+import threading
+import time
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from recipes.models import Stamp
+
+INGREDIENTS = 'ingredients'
+TAGS = 'tags'
+
+
+def get_recipe_cache_key(recipe, request=None, image_variant=''):
+    """Ключ общей части представления рецепта.
+    Ссылки на изображения абсолютные, поэтому учитываем адрес сайта
+    и вариант изображения."""
+    base_url = request.build_absolute_uri('/') if request else ''
+    prefix = md5(base_url.encode()).hexdigest()[:8]
+    return f'recipe:{prefix}:{image_variant}:{recipe.pk}:{recipe.version}'
+
+
+def get_cached_recipes(recipes, request, image_variant, build):
+    """Получаем общие части представлений рецептов из кэша.
+    Отсутствующие представления строим функцией build одним списком
+    и сохраняем."""
+    keys = [
+        get_recipe_cache_key(recipe, request, image_variant)
+        for recipe in recipes
+    ]
+    cached = cache.get_many(keys)
+    missing = [
+        (key, recipe)
+        for key, recipe in zip(keys, recipes)
+        if key not in cached
+    ]
+    if missing:
+        built = dict(zip(
+            (key for key, _ in missing),
+            build([recipe for _, recipe in missing])
+        ))
+        cache.set_many(built, settings.RECIPE_CACHE_TIMEOUT)
+        cached.update(built)
+    return [cached[key] for key in keys]
+
+
+def get_count_cache_key(queryset):
+    """Ключ количества объектов по тексту запроса с параметрами."""
+    sql, params = queryset.query.sql_with_params()
+    query = f'{queryset.db}:{sql}:{params!r}'
+    return f'count:{md5(query.encode()).hexdigest()}'
+
+
+def get_stamp(name):
+    """Получаем метку последнего изменения набора данных.
+    Пока набор данных не менялся, метки нет."""
+    return Stamp.objects.filter(name=name).values_list(
+        'modified', flat=True
+    ).first()
+
+
+def touch(name):
+    """Отмечаем изменение набора данных.
+    Данные текущего процесса перестраиваются сразу,
+    остальные процессы увидят метку при следующей проверке."""
+    Stamp.objects.update_or_create(
+        name=name, defaults={'modified': timezone.now()}
+    )
+    for index in StampedIndex.instances:
+        if index.stamp_name == name:
+            index.checked = None
+
+
+def touch_on_commit(name):
+    """Отмечаем изменение после фиксации транзакции,
+    чтобы перестроенные данные не прочитали старые строки."""
+    transaction.on_commit(lambda: touch(name))
+
+
+class StampedIndex:
+    """Данные в памяти процесса.
+    Строятся при первом обращении и перестраиваются после изменения
+    набора данных с меткой stamp_name. Метка проверяется не чаще
+    раза в STAMP_CHECK_INTERVAL секунд."""
+    stamp_name = None
+    instances = []
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stamp = None
+        self.checked = None
+        self.instances.append(self)
+
+    def build(self, stamp):
+        raise NotImplementedError
+
+    def refresh(self):
+        """Перестраиваем данные, если набор данных изменился.
+        Метку читаем до данных, поэтому изменение, зафиксированное
+        во время перестроения, вызовет ещё одно перестроение."""
+        now = time.monotonic()
+        checked = self.checked
+        if (
+            checked is not None
+            and now - checked < settings.STAMP_CHECK_INTERVAL
+        ):
+            return
+        stamp = get_stamp(self.stamp_name)
+        with self.lock:
+            if self.checked is None or stamp != self.stamp:
+                self.build(stamp)
+                self.stamp = stamp
+            self.checked = now
@@ -0,0 +1,72 @@
+import gzip
+import time
+from hashlib import sha1
+from io import BytesIO
+
+from django.http import HttpResponse
+from django.utils.cache import (get_conditional_response,
+                                patch_cache_control, patch_vary_headers)
+from django.utils.http import http_date
+from rest_framework.renderers import JSONRenderer
+
+from .cache import StampedIndex
+
+
+def compress(content):
+    """Сжимаем gzip без времени в заголовке, чтобы ETag не менялся."""
+    buffer = BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode='wb', mtime=0) as file:
+        file.write(content)
+    return buffer.getvalue()
+
+
+class Catalog(StampedIndex):
+    """Справочник, заранее отрисованный в JSON и сжатый gzip.
+    Отрисовка повторяется только после изменения метки справочника."""
+    def __init__(self, name, queryset, serializer_class):
+        super().__init__()
+        self.stamp_name = name
+        self.queryset = queryset
+        self.serializer_class = serializer_class
+        self.built = None
+
+    def build(self, stamp):
+        """Отрисовываем справочник в обычном и сжатом виде."""
+        serializer = self.serializer_class(self.queryset.all(), many=True)
+        content = JSONRenderer().render(serializer.data)
+        modified = stamp.timestamp() if stamp else time.time()
+        self.built = (modified, {
+            encoding: (body, f'"{sha1(body).hexdigest()}"')
+            for encoding, body in (
+                (None, content),
+                ('gzip', compress(content)),
+            )
+        })
+
+    def get_response(self, request):
+        """Отдаём справочник с поддержкой условных запросов."""
+        self.refresh()
+        accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        encoding = 'gzip' if 'gzip' in accept_encoding else None
+        modified, variants = self.built
+        body, etag = variants[encoding]
+        response = HttpResponse(body, content_type='application/json')
+        if encoding:
+            response['Content-Encoding'] = encoding
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(modified)
+        patch_vary_headers(response, ('Accept-Encoding',))
+        patch_cache_control(response, no_cache=True)
+        return get_conditional_response(
+            request, etag, int(modified), response
+        )
+
+
+class CatalogMixin:
+    """Отдаём список объектов из заранее отрисованного справочника."""
+    catalog = None
+
+    def list(self, request, *args, **kwargs):
+        if request.accepted_renderer.format != 'json':
+            return super().list(request, *args, **kwargs)
+        return self.catalog.get_response(request)
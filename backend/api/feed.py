@@ -0,0 +1,113 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from recipes.models import FeedItem, Recipe
+from users.models import Subscribe
+from .pagination import filter_after
+from .tasks import submit
+
+User = get_user_model()
+
+BATCH_SIZE = 1000
+
+
+def is_merged_on_read(author):
+    """Рецепты очень плодовитых авторов не раскладываем по лентам,
+    а добавляем в ленту при чтении."""
+    return author.recipes_count > settings.FEED_MAX_AUTHOR_RECIPES
+
+
+def fan_out(recipe_id):
+    """Добавляем новый рецепт в ленты подписчиков автора."""
+    recipe = Recipe.objects.select_related('author').filter(
+        id=recipe_id
+    ).first()
+    if recipe is None or is_merged_on_read(recipe.author):
+        return
+    FeedItem.objects.bulk_create(
+        (
+            FeedItem(user_id=user_id, recipe=recipe, pub_date=recipe.pub_date)
+            for user_id in Subscribe.objects.filter(
+                author_id=recipe.author_id
+            ).values_list('user_id', flat=True).iterator()
+        ),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True
+    )
+
+
+def backfill(user, author):
+    """Добавляем в ленту рецепты автора, на которого подписались."""
+    if is_merged_on_read(author):
+        return
+    FeedItem.objects.bulk_create(
+        (
+            FeedItem(user=user, recipe_id=recipe_id, pub_date=pub_date)
+            for recipe_id, pub_date in Recipe.objects.filter(
+                author=author
+            ).values_list('id', 'pub_date')
+        ),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True
+    )
+
+
+def backfill_followers(author_id):
+    """Добавляем все рецепты автора в ленты его подписчиков.
+    Нужно, когда автор перестал быть плодовитым: рецепты,
+    опубликованные до этого, в ленты не раскладывались."""
+    author = User.objects.filter(id=author_id).first()
+    if author is None or is_merged_on_read(author):
+        return
+    recipes = list(Recipe.objects.filter(author=author).values_list(
+        'id', 'pub_date'
+    ))
+    FeedItem.objects.bulk_create(
+        (
+            FeedItem(user_id=user_id, recipe_id=recipe_id, pub_date=pub_date)
+            for user_id in Subscribe.objects.filter(
+                author=author
+            ).values_list('user_id', flat=True).iterator()
+            for recipe_id, pub_date in recipes
+        ),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True
+    )
+
+
+def on_recipe_deleted(author_id):
+    """Если после удаления рецепта автор перестал быть плодовитым,
+    в фоне раскладываем его рецепты по лентам подписчиков."""
+    if User.objects.filter(
+        id=author_id, recipes_count=settings.FEED_MAX_AUTHOR_RECIPES
+    ).exists():
+        transaction.on_commit(lambda: submit(backfill_followers, author_id))
+
+
+def remove(user, author):
+    """Убираем из ленты рецепты автора после отписки."""
+    FeedItem.objects.filter(user=user, recipe__author=author).delete()
+
+
+def get_feed(user, queryset, position, size):
+    """Получаем рецепты ленты после позиции курсора.
+    Страница записей ленты объединяется со страницей рецептов
+    плодовитых авторов, оба запроса идут по индексам."""
+    items = filter_after(
+        FeedItem.objects.filter(user=user), position, pk='recipe_id'
+    ).order_by('-pub_date', 'recipe_id').values_list('pub_date', 'recipe_id')
+    authors = User.objects.filter(
+        following__user=user,
+        recipes_count__gt=settings.FEED_MAX_AUTHOR_RECIPES
+    )
+    recipes = filter_after(
+        Recipe.objects.filter(author__in=authors), position
+    ).order_by('-pub_date', 'id').values_list('pub_date', 'id')
+    rows = sorted(
+        set(items[:size]) | set(recipes[:size]),
+        key=lambda row: (-row[0].timestamp(), row[1])
+    )[:size]
+    ids = [recipe_id for _, recipe_id in rows]
+    recipes_by_id = queryset.in_bulk(ids)
+    return [recipes_by_id[pk] for pk in ids if pk in recipes_by_id]
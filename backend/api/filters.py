@@ -1,15 +1,55 @@
-from django.db.models import BooleanField, ExpressionWrapper, Q
+from django import forms
 from django_filters.rest_framework import FilterSet, filters
-from recipes.models import Ingredient, Recipe, Tag
+from django_filters.widgets import QueryArrayWidget
+from recipes.models import Favorite, Recipe, ShoppingCart
+
+from .search import tag_registry
+
+
+class TagSlugsField(forms.Field):
+    """Список слагов тэгов, проверяемых по реестру тэгов.
+    Очищенное значение — идентификаторы найденных тэгов."""
+    widget = QueryArrayWidget
+    default_error_messages = {
+        'invalid_choice': 'Тэг %(value)s не найден',
+    }
+
+    def to_python(self, value):
+        return [slug for slug in value or () if slug]
+
+    def clean(self, value):
+        slugs = self.to_python(value)
+        self.validate(slugs)
+        if not slugs:
+            return []
+        found = tag_registry.get_ids(slugs)
+        for slug in slugs:
+            if slug not in found:
+                raise forms.ValidationError(
+                    self.error_messages['invalid_choice'],
+                    code='invalid_choice',
+                    params={'value': slug},
+                )
+        return list(found.values())
+
+
+class TagsFilter(filters.Filter):
+    """Фильтр по любому из тэгов.
+    Вместо соединения с тэгами используем подзапрос,
+    поэтому рецепты не дублируются."""
+    field_class = TagSlugsField
+
+    def filter(self, queryset, value):
+        if not value:
+            return queryset
+        return queryset.filter(id__in=Recipe.tags.through.objects.filter(
+            tag_id__in=value
+        ).values('recipe_id'))
 
 
 class FilterRecipe(FilterSet):
     """Фильтация рецептов в соответствии с параметрами запроса."""
-    tags = filters.ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        to_field_name='slug',
-        queryset=Tag.objects.all(),
-    )
+    tags = TagsFilter()
 
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
@@ -23,33 +63,16 @@ class FilterRecipe(FilterSet):
         """Фильтруем по добавлению в избранное."""
         user = self.request.user
         if value and not user.is_anonymous:
-            return queryset.filter(favorites__user=user)
+            return queryset.filter(id__in=Favorite.objects.filter(
+                user=user
+            ).values('recipe_id'))
         return queryset
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
         """Фильтруем по добавлению в корзину."""
         user = self.request.user
         if value and not user.is_anonymous:
-            return queryset.filter(shopping_cart__user=user)
+            return queryset.filter(id__in=ShoppingCart.objects.filter(
+                user=user
+            ).values('recipe_id'))
         return queryset
-
-
-class FilterIngredient(FilterSet):
-    """Фильтация ингредиентов в соответствии с параметрами запроса."""
-    name = filters.CharFilter(method='name_filter')
-
-    class Meta:
-        model = Ingredient
-        fields = ('name',)
-
-    def name_filter(self, queryset, name, value):
-        """Фильтруем название по вхождению в начало
-        и по вхождению в произвольном месте названия."""
-        return queryset.filter(
-            Q(name__istartswith=value) | Q(name__icontains=value)
-        ).annotate(
-            startswith=ExpressionWrapper(
-                Q(name__istartswith=value),
-                output_field=BooleanField()
-            )
-        ).order_by('-startswith')
@@ -0,0 +1,87 @@
+import io
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import F
+from PIL import Image, features
+
+from recipes.models import Recipe
+
+VARIANTS = {
+    'thumbnail': (240, 240),
+    'card': (720, 480),
+    'full': (1600, 1600),
+}
+FORMATS = {
+    'WEBP': 'webp',
+    'JPEG': 'jpg',
+}
+
+
+def get_format():
+    """Формат уменьшенных изображений: WebP, если Pillow его умеет."""
+    image_format = settings.RECIPE_IMAGE_FORMAT
+    if image_format == 'WEBP' and not features.check('webp'):
+        return 'JPEG'
+    return image_format
+
+
+def get_variant_name(name, variant):
+    """Путь варианта изображения рядом с оригиналом."""
+    directory, file_name = os.path.split(name)
+    root = os.path.splitext(file_name)[0]
+    extension = FORMATS[get_format()]
+    return os.path.join(directory, 'variants', f'{root}_{variant}.{extension}')
+
+
+def get_variant(recipe, variant):
+    """Файл варианта изображения рецепта или оригинал,
+    если варианты ещё не готовы."""
+    image = recipe.image
+    if not image or not variant or not recipe.has_image_variants:
+        return image
+    return image.field.attr_class(
+        recipe, image.field, get_variant_name(image.name, variant)
+    )
+
+
+def encode(image, size, image_format):
+    """Уменьшаем изображение и кодируем его с заданным качеством."""
+    image = image.copy()
+    image.thumbnail(size, Image.LANCZOS)
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    elif image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+    buffer = io.BytesIO()
+    image.save(
+        buffer,
+        image_format,
+        quality=settings.RECIPE_IMAGE_QUALITY,
+        optimize=True
+    )
+    return buffer.getvalue()
+
+
+def generate_variants(recipe_id):
+    """Создаём варианты изображения рецепта.
+    Версия рецепта увеличивается, только если изображение
+    не сменилось за время обработки."""
+    recipe = Recipe.objects.filter(id=recipe_id).first()
+    if recipe is None or not recipe.image:
+        return
+    image_format = get_format()
+    with recipe.image.open('rb') as file, Image.open(file) as image:
+        image.load()
+        for variant, size in VARIANTS.items():
+            name = get_variant_name(recipe.image.name, variant)
+            if default_storage.exists(name):
+                default_storage.delete(name)
+            default_storage.save(
+                name, ContentFile(encode(image, size, image_format))
+            )
+    Recipe.objects.filter(id=recipe_id, image=recipe.image.name).update(
+        has_image_variants=True, version=F('version') + 1
+    )
@@ -0,0 +1,263 @@
+import json
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, Recipe, Tag
+
+User = get_user_model()
+
+PAGE_SIZES = (1, 10, 50)
+SCALED_ENDPOINTS = (
+    '/api/recipes/',
+    '/api/users/',
+    '/api/users/subscriptions/',
+    '/api/recipes/feed/',
+)
+DEFAULT_BUDGETS = {
+    'recipes': {'queries': 6},
+    'recipes cold': {'queries': 8},
+    'recipes anonymous': {'queries': 4},
+    'recipes tags': {'queries': 6},
+    'recipes author': {'queries': 6},
+    'recipes is_favorited': {'queries': 6},
+    'recipes is_in_shopping_cart': {'queries': 6},
+    'recipes tags is_favorited': {'queries': 6},
+    'recipes cursor': {'queries': 5},
+    'recipe detail': {'queries': 5},
+    'feed': {'queries': 5},
+    'feed cold': {'queries': 7},
+    'subscriptions': {'queries': 4},
+    'ingredients search': {'queries': 1},
+    'users': {'queries': 3},
+    'download_shopping_cart': {'queries': 1},
+    'download_shopping_cart uncached': {'queries': 2},
+    'download_shopping_cart txt': {'queries': 1},
+}
+
+
+def get_private_caches():
+    """Настройки кэшей с теми же параметрами, но в памяти процесса."""
+    return {
+        alias: {
+            **config,
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': f'benchmark-{alias}',
+        }
+        for alias, config in settings.CACHES.items()
+    }
+
+
+class Command(BaseCommand):
+    """Замер горячих эндпоинтов на текущих данных.
+    Для каждого эндпоинта записывается количество запросов к базе,
+    время ответа и размер ответа."""
+    help = 'Benchmarks hot API endpoints against the current database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument(
+            '--user',
+            help='Email пользователя, от имени которого идут запросы'
+        )
+        parser.add_argument(
+            '--budgets',
+            help='Файл json с бюджетами вида {"name": {"queries": 5, '
+                 '"time_ms": 100, "size": 100000}}'
+        )
+        parser.add_argument(
+            '--baseline',
+            help='Файл json с результатами предыдущего замера для сравнения'
+        )
+        parser.add_argument(
+            '--save-baseline',
+            help='Сохранить результаты замера в файл json'
+        )
+        parser.add_argument(
+            '--time-tolerance', type=float, default=1.5,
+            help='Допустимое замедление относительно базового замера'
+        )
+
+    def handle(self, *args, **options):
+        """Замер идёт на собственных кэшах в памяти процесса:
+        команда очищает кэши и не должна затрагивать общий кэш сервера."""
+        with override_settings(CACHES=get_private_caches()):
+            self.run(options)
+
+    def run(self, options):
+        self.repeat = options['repeat']
+        user = self.get_user(options['user'])
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+        self.anonymous = APIClient()
+        results = {
+            name: self.measure(client, url, setup)
+            for name, client, url, setup in self.get_endpoints(user)
+        }
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:36} {result["queries"]:4} queries '
+                f'{result["time_ms"]:9.1f} ms {result["size"]:9} bytes'
+            )
+        errors = self.check_scaling()
+        errors += self.check_budgets(results, self.load(options['budgets']))
+        if options['baseline']:
+            errors += self.check_baseline(
+                results,
+                self.load(options['baseline']),
+                options['time_tolerance']
+            )
+        if options['save_baseline']:
+            with open(options['save_baseline'], 'w') as file:
+                json.dump(results, file, indent=2, sort_keys=True)
+        if errors:
+            raise CommandError('\n'.join(errors))
+        self.stdout.write(self.style.SUCCESS('All budgets met'))
+
+    def get_user(self, email):
+        """По умолчанию берём пользователя с самой большой корзиной."""
+        users = User.objects.all()
+        if email:
+            users = users.filter(email=email)
+        user = users.annotate(
+            cart_size=Count('shopping_cart')
+        ).order_by('-cart_size').first()
+        if user is None:
+            raise CommandError('Нет пользователей, запустите generate_data')
+        return user
+
+    def get_endpoints(self, user):
+        tags = '&'.join(
+            f'tags={slug}'
+            for slug in Tag.objects.values_list('slug', flat=True)[:2]
+        )
+        recipe = Recipe.objects.first()
+        ingredient = Ingredient.objects.first()
+        search = ingredient.name[:3] if ingredient else 'а'
+        clear_documents = caches['documents'].clear
+        return (
+            ('recipes', self.client, '/api/recipes/', None),
+            ('recipes cold', self.client, '/api/recipes/', cache.clear),
+            ('recipes anonymous', self.anonymous, '/api/recipes/', None),
+            ('recipes tags', self.client, f'/api/recipes/?{tags}', None),
+            ('recipes author', self.client,
+             f'/api/recipes/?author={recipe.author_id if recipe else 0}',
+             None),
+            ('recipes is_favorited', self.client,
+             '/api/recipes/?is_favorited=1', None),
+            ('recipes is_in_shopping_cart', self.client,
+             '/api/recipes/?is_in_shopping_cart=1', None),
+            ('recipes tags is_favorited', self.client,
+             f'/api/recipes/?{tags}&is_favorited=1', None),
+            ('recipes cursor', self.client, '/api/recipes/?cursor=', None),
+            ('recipe detail', self.client,
+             f'/api/recipes/{recipe.id if recipe else 0}/', None),
+            ('feed', self.client, '/api/recipes/feed/', None),
+            ('feed cold', self.client, '/api/recipes/feed/', cache.clear),
+            ('subscriptions', self.client,
+             '/api/users/subscriptions/?recipes_limit=3', None),
+            ('ingredients search', self.anonymous,
+             f'/api/ingredients/?name={search}', None),
+            ('users', self.client, '/api/users/', None),
+            ('download_shopping_cart', self.client,
+             '/api/recipes/download_shopping_cart/', None),
+            ('download_shopping_cart uncached', self.client,
+             '/api/recipes/download_shopping_cart/', clear_documents),
+            ('download_shopping_cart txt', self.client,
+             '/api/recipes/download_shopping_cart/?format=txt', None),
+        )
+
+    def request(self, client, url):
+        """Выполняем запрос и считаем полный размер ответа."""
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = client.get(url)
+            if response.streaming:
+                size = sum(len(chunk) for chunk in response.streaming_content)
+            else:
+                size = len(response.content)
+            elapsed = time.perf_counter() - started
+        if response.status_code >= 400:
+            raise CommandError(f'{url}: {response.status_code}')
+        return len(queries), elapsed * 1000, size
+
+    def measure(self, client, url, setup=None):
+        """Первый запрос прогревает кэши, затем берём медиану времени."""
+        self.request(client, url)
+        runs = []
+        for _ in range(self.repeat):
+            if setup:
+                setup()
+            runs.append(self.request(client, url))
+        return {
+            'queries': max(run[0] for run in runs),
+            'time_ms': statistics.median(run[1] for run in runs),
+            'size': max(run[2] for run in runs),
+        }
+
+    def check_scaling(self):
+        """Количество запросов не должно зависеть от размера страницы.
+        Каждую страницу запрашиваем с пустым кэшем рецептов,
+        чтобы проверить построение представлений, и с прогретым."""
+        errors = []
+        for url in SCALED_ENDPOINTS:
+            for state in ('cold', 'warm'):
+                queries = {}
+                for limit in PAGE_SIZES:
+                    if state == 'cold':
+                        cache.clear()
+                    queries[limit] = self.request(
+                        self.client, f'{url}?limit={limit}'
+                    )[0]
+                self.stdout.write(
+                    f'{url} {state} queries by page size: {queries}'
+                )
+                if len(set(queries.values())) > 1:
+                    errors.append(
+                        f'{url}: {state} queries grow with page size '
+                        f'{queries}'
+                    )
+        return errors
+
+    @staticmethod
+    def load(path):
+        if path is None:
+            return DEFAULT_BUDGETS
+        with open(path) as file:
+            return json.load(file)
+
+    @staticmethod
+    def check_budgets(results, budgets):
+        return [
+            f'{name}: {metric} {results[name][metric]} > {limit}'
+            for name, budget in budgets.items() if name in results
+            for metric, limit in budget.items()
+            if results[name][metric] > limit
+        ]
+
+    @staticmethod
+    def check_baseline(results, baseline, tolerance):
+        errors = []
+        for name, base in baseline.items():
+            result = results.get(name)
+            if result is None:
+                continue
+            if result['queries'] > base['queries']:
+                errors.append(
+                    f'{name}: queries {result["queries"]} '
+                    f'> baseline {base["queries"]}'
+                )
+            if result['time_ms'] > base['time_ms'] * tolerance:
+                errors.append(
+                    f'{name}: {result["time_ms"]:.1f} ms '
+                    f'> baseline {base["time_ms"]:.1f} ms x {tolerance}'
+                )
+        return errors
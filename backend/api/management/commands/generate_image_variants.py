@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from api.images import generate_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    """Создание уменьшенных изображений для уже загруженных рецептов."""
+    help = 'Generates image variants for recipes that do not have them'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Пересоздать варианты для всех рецептов'
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.filter(has_image_variants=False)
+        recipe_ids = list(recipes.values_list('id', flat=True))
+        for number, recipe_id in enumerate(recipe_ids, 1):
+            try:
+                generate_variants(recipe_id)
+            except OSError as error:
+                self.stderr.write(f'Recipe {recipe_id}: {error}')
+            if number % 100 == 0:
+                self.stdout.write(f'Processed {number} of {len(recipe_ids)}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Done: {len(recipe_ids)} recipes'
+        ))
@@ -1,7 +1,173 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as DecodeError
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q, QuerySet
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from .cache import get_count_cache_key
+
+
+class CountCachePaginator(Paginator):
+    """Пагинатор с приблизительным количеством для больших выборок.
+    Большое количество кэшируем ненадолго по тексту запроса,
+    на PostgreSQL для выборок, которые уже оказывались огромными,
+    берём оценку планировщика."""
+    @cached_property
+    def count(self):
+        if not isinstance(self.object_list, QuerySet):
+            return super().count
+        queryset = self.get_counted_queryset()
+        try:
+            key = get_count_cache_key(queryset)
+        except EmptyResultSet:
+            return 0
+        large_key = f'{key}:large'
+        cached = cache.get_many((key, large_key))
+        if key in cached:
+            return cached[key]
+        count = None
+        if large_key in cached:
+            count = self.get_estimate(queryset)
+        if count is None:
+            count = queryset.count()
+        threshold = settings.PAGINATION_COUNT_ESTIMATE_MIN
+        if threshold and count >= threshold:
+            cache.set(
+                large_key, True, settings.PAGINATION_COUNT_LARGE_TIMEOUT
+            )
+        elif large_key in cached:
+            cache.delete(large_key)
+        if count >= settings.PAGINATION_COUNT_CACHE_MIN:
+            cache.set(key, count, settings.PAGINATION_COUNT_CACHE_TIMEOUT)
+        return count
+
+    def get_counted_queryset(self):
+        """Запрос для подсчёта без сортировки и без аннотаций в выборке.
+        Отметки пользователя, например is_favorited, на количество
+        не влияют, поэтому количество общее для всех пользователей.
+        Запросы с агрегатами считаем как есть, так как агрегаты
+        меняют группировку строк."""
+        queryset = self.object_list.order_by()
+        if any(
+            annotation.contains_aggregate
+            for annotation in queryset.query.annotations.values()
+        ):
+            return queryset
+        return queryset.values('pk')
+
+    def get_estimate(self, queryset):
+        """Оценка планировщика, если она превышает порог."""
+        threshold = settings.PAGINATION_COUNT_ESTIMATE_MIN
+        if not threshold or connections[queryset.db].vendor != 'postgresql':
+            return None
+        sql, params = queryset.query.sql_with_params()
+        with connections[queryset.db].cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        estimate = plan[0]['Plan']['Plan Rows']
+        return estimate if estimate >= threshold else None
 
 
 class PageLimitPagination(PageNumberPagination):
     """Стандартный пагинатор с переопределённым названием поля,
     отвечающего за количество результатов в выдаче"""
+    django_paginator_class = CountCachePaginator
     page_size_query_param = 'limit'
+    max_page_size = 100
+
+
+def filter_after(queryset, position, pub_date='pub_date', pk='id'):
+    """Оставляем объекты, идущие после позиции (дата публикации, id)
+    в порядке убывания даты и возрастания id.
+    Избыточное условие на дату даёт планировщику границу
+    для просмотра индекса."""
+    if position is None:
+        return queryset
+    value, key = position
+    return queryset.filter(
+        Q(**{f'{pub_date}__lte': value}),
+        Q(**{f'{pub_date}__lt': value})
+        | Q(**{pub_date: value, f'{pk}__gt': key})
+    )
+
+
+class RecipePagination(PageLimitPagination):
+    """Пагинатор рецептов.
+    С параметром cursor выдача идёт по ключу (дата публикации, id)
+    без подсчёта количества и смещения, иначе постранично."""
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Некорректный курсор'
+    ordering = ('-pub_date', 'id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.use_cursor = self.cursor_query_param in request.query_params
+        if not self.use_cursor:
+            return super().paginate_queryset(queryset, request, view)
+        queryset = queryset.order_by(*self.ordering)
+        return self.paginate_keyset(
+            lambda position, size: list(
+                filter_after(queryset, position)[:size]
+            ),
+            request
+        )
+
+    def paginate_keyset(self, get_results, request):
+        """Получаем страницу функцией get_results(position, size),
+        которая возвращает рецепты после позиции курсора."""
+        self.use_cursor = True
+        self.request = request
+        page_size = self.get_page_size(request)
+        results = get_results(self.decode_cursor(request), page_size + 1)
+        self.has_next = len(results) > page_size
+        self.results = results[:page_size]
+        return self.results
+
+    def get_paginated_response(self, data):
+        if not self.use_cursor:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.get_next_cursor_link(),
+            'results': data,
+        })
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            pub_date, pk = urlsafe_b64decode(
+                cursor.encode()
+            ).decode().split('|')
+            pub_date, pk = parse_datetime(pub_date), int(pk)
+        except (DecodeError, UnicodeDecodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if pub_date is None:
+            raise NotFound(self.invalid_cursor_message)
+        return pub_date, pk
+
+    def encode_cursor(self, recipe):
+        return urlsafe_b64encode(
+            f'{recipe.pub_date.isoformat()}|{recipe.id}'.encode()
+        ).decode()
+
+    def get_next_cursor_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(self.results[-1])
+        )
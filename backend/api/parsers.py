@@ -0,0 +1,53 @@
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.http.multipartparser import \
+    MultiPartParser as DjangoMultiPartParser
+from django.http.multipartparser import MultiPartParserError
+from rest_framework import status
+from rest_framework.exceptions import (APIException, ParseError,
+                                       UnsupportedMediaType)
+from rest_framework.parsers import DataAndFiles, MultiPartParser
+
+
+class PayloadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Изображение слишком большое'
+    default_code = 'payload_too_large'
+
+
+class ImageUploadHandler(TemporaryFileUploadHandler):
+    """Потоково сохраняем изображение во временный файл.
+    Загрузку прерываем, как только файл превысил допустимый размер
+    или оказался не изображением."""
+    def new_file(self, field_name, file_name, content_type, *args, **kwargs):
+        if not content_type.startswith('image/'):
+            raise UnsupportedMediaType(content_type)
+        super().new_file(field_name, file_name, content_type, *args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > settings.RECIPE_IMAGE_MAX_SIZE:
+            self.file.close()
+            raise PayloadTooLarge()
+        return super().receive_data_chunk(raw_data, start)
+
+
+class RecipeMultiPartParser(MultiPartParser):
+    """Разбор multipart запросов с изображением рецепта.
+    Запрос с заведомо слишком большим телом отклоняем до чтения."""
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = parser_context['request']
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+        if content_length > settings.RECIPE_UPLOAD_MAX_SIZE:
+            raise PayloadTooLarge()
+        meta = request.META.copy()
+        meta['CONTENT_TYPE'] = media_type
+        try:
+            data, files = DjangoMultiPartParser(
+                meta,
+                stream,
+                [ImageUploadHandler(request)],
+                parser_context.get('encoding', settings.DEFAULT_CHARSET)
+            ).parse()
+        except MultiPartParserError as exc:
+            raise ParseError(f'Multipart form parse error - {exc}')
+        return DataAndFiles(data, files)
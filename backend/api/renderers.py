@@ -0,0 +1,35 @@
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+
+class DocumentRenderer(BaseRenderer):
+    """Рендерер для выбора формата списка покупок.
+    Сами документы отдаются потоком из вьюсета,
+    здесь отрисовываются только сообщения об ошибках."""
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response = (renderer_context or {}).get('response')
+        if response is not None:
+            response['Content-Type'] = 'application/json'
+        return JSONRenderer().render(data)
+
+
+class PDFRenderer(DocumentRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+
+
+class PlainTextRenderer(DocumentRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+
+class CSVRenderer(DocumentRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+SHOPPING_LIST_RENDERERS = (
+    PDFRenderer, PlainTextRenderer, CSVRenderer, JSONRenderer
+)
@@ -0,0 +1,51 @@
+from bisect import bisect_left
+
+from recipes.models import Ingredient, Tag
+from .cache import INGREDIENTS, TAGS, StampedIndex
+
+
+class IngredientIndex(StampedIndex):
+    """Индекс названий ингредиентов."""
+    stamp_name = INGREDIENTS
+    data = ((), ())
+
+    def build(self, stamp):
+        """Загружаем ингредиенты, упорядоченные по названию."""
+        items = sorted(
+            Ingredient.objects.values('id', 'name', 'measurement_unit'),
+            key=lambda item: (item['name'].lower(), item['id'])
+        )
+        self.data = ([item['name'].lower() for item in items], items)
+
+    def search(self, value):
+        """Ищем ингредиенты по вхождению в начало названия,
+        а затем по вхождению в произвольном месте названия."""
+        self.refresh()
+        names, items = self.data
+        value = value.lower()
+        start = end = bisect_left(names, value)
+        while end < len(names) and names[end].startswith(value):
+            end += 1
+        return items[start:end] + [
+            item for position, (name, item) in enumerate(zip(names, items))
+            if value in name and not start <= position < end
+        ]
+
+
+class TagRegistry(StampedIndex):
+    """Соответствие слагов тэгов их идентификаторам."""
+    stamp_name = TAGS
+    ids = {}
+
+    def build(self, stamp):
+        self.ids = dict(Tag.objects.values_list('slug', 'id'))
+
+    def get_ids(self, slugs):
+        """Идентификаторы тэгов по слагам, неизвестные слаги пропускаем."""
+        self.refresh()
+        ids = self.ids
+        return {slug: ids[slug] for slug in slugs if slug in ids}
+
+
+ingredient_index = IngredientIndex()
+tag_registry = TagRegistry()
@@ -1,12 +1,18 @@
+import json
+
 from django.contrib.auth import get_user_model
-from django.db.models import F
-from django.shortcuts import get_object_or_404
+from django.core.files.uploadedfile import UploadedFile
+from django.db import models, transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
 from recipes.models import Ingredient, IngredientsAmount, Recipe, Tag
+from .cache import get_cached_recipes
+from .images import generate_variants, get_variant
+from .tasks import submit
 
 User = get_user_model()
 
@@ -14,10 +20,31 @@ MIN_AMOUNT = 0
 MAX_AMOUNT = 32000
 
 
+class RecipeImageField(Base64ImageField):
+    """Изображение рецепта, принимаемое в base64.
+    В ответе отдаётся уменьшенный вариант изображения: заданный
+    при объявлении поля или выбранный вьюсетом в контексте."""
+    def __init__(self, variant=None, **kwargs):
+        self.variant = variant
+        super().__init__(**kwargs)
+
+    def get_variant(self):
+        return self.variant or self.context.get('image_variant', 'full')
+
+    def to_internal_value(self, data):
+        """Файл из multipart запроса проверяем как обычное изображение."""
+        if isinstance(data, UploadedFile):
+            return serializers.ImageField.to_internal_value(self, data)
+        return super().to_internal_value(data)
+
+    def get_attribute(self, instance):
+        return get_variant(instance, self.get_variant())
+
+
 class RecipeShortSerializer(serializers.ModelSerializer):
     """Сериализатор для отображения коротокой информации о рецепте.
     Необходим для части эндпоинтов."""
-    image = Base64ImageField()
+    image = RecipeImageField(variant='thumbnail')
 
     class Meta:
         model = Recipe
@@ -61,10 +88,21 @@ class CustomUserSerializer(UserSerializer):
         )
 
     def get_is_subscribed(self, obj):
-        """Получаем данные о подписках пользователя."""
-        user = self.context.get('request').user
-        if not user.is_anonymous:
-            return user.follower.exists()
+        """Проверяем подписан ли пользователь на автора."""
+        request = self.context.get('request')
+        if request is None or request.user.is_anonymous:
+            return False
+        return obj.id in self.get_followed_authors(request)
+
+    @staticmethod
+    def get_followed_authors(request):
+        """Загружаем авторов, на которых подписан пользователь.
+        Запрос выполняется один раз и сохраняется до конца запроса."""
+        if not hasattr(request, 'followed_authors'):
+            request.followed_authors = set(
+                request.user.follower.values_list('author_id', flat=True)
+            )
+        return request.followed_authors
 
 
 class SubscribeSerializer(CustomUserSerializer):
@@ -78,18 +116,16 @@ class SubscribeSerializer(CustomUserSerializer):
         )
 
     def get_recipes(self, obj):
-        """Получаем информацию о рецептах автора."""
-        request = self.context.get('request')
-        context = {'request': request}
-        recipe_limit = request.query_params.get('recipe_limit')
-        queryset = obj.recipes.all()
-        if recipe_limit:
-            queryset = queryset[: int(recipe_limit)]
-        return RecipeShortSerializer(queryset, context=context, many=True).data
+        """Получаем информацию о рецептах автора.
+        Рецепты загружаются во вьюсете сразу для всей страницы."""
+        context = {'request': self.context.get('request')}
+        recipes = self.context.get('recipes', {}).get(obj.id, [])
+        return RecipeShortSerializer(recipes, context=context, many=True).data
 
     def get_recipes_count(self, obj):
-        """Получаем данные об общем количестве рецептов автора."""
-        return obj.recipes.count()
+        """Получаем данные об общем количестве рецептов автора
+        из счётчика автора."""
+        return obj.recipes_count
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -106,6 +142,14 @@ class IngredientSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class RecipeListSerializer(serializers.ListSerializer):
+    """Сериализатор списка рецептов.
+    Общие части представлений читаются из кэша одним обращением."""
+    def to_representation(self, data):
+        recipes = data.all() if isinstance(data, models.Manager) else data
+        return self.child.to_representation_many(list(recipes))
+
+
 class RecipeSerializer(serializers.ModelSerializer):
     """Сериализато для рецептов"""
     tags = TagSerializer(many=True, read_only=True)
@@ -113,7 +157,8 @@ class RecipeSerializer(serializers.ModelSerializer):
     ingredients = serializers.SerializerMethodField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
-    image = Base64ImageField()
+    favorites_count = serializers.IntegerField(read_only=True)
+    image = RecipeImageField()
 
     class Meta:
         model = Recipe
@@ -124,88 +169,283 @@ class RecipeSerializer(serializers.ModelSerializer):
             'ingredients',
             'is_favorited',
             'is_in_shopping_cart',
+            'favorites_count',
             'name',
             'image',
             'text',
             'cooking_time',
         )
+        list_serializer_class = RecipeListSerializer
+
+    def to_representation(self, instance):
+        return self.to_representation_many([instance])[0]
+
+    def to_representation_many(self, recipes):
+        """Собираем представления рецептов из кэша.
+        Поля, зависящие от пользователя, добавляем после кэша."""
+        cached = get_cached_recipes(
+            recipes,
+            self.context.get('request'),
+            self.fields['image'].get_variant(),
+            self.get_common_representations
+        )
+        return [
+            self.add_user_representation(recipe, data)
+            for recipe, data in zip(recipes, cached)
+        ]
+
+    def get_common_representations(self, recipes):
+        """Строим представления рецептов, которых нет в кэше.
+        Тэги и ингредиенты загружаются только для этих рецептов."""
+        prefetch_related_objects(
+            recipes,
+            'tags',
+            Prefetch(
+                'ingredient',
+                queryset=IngredientsAmount.objects.select_related(
+                    'ingredient'
+                ).order_by('ingredient__name')
+            ),
+        )
+        return [self.get_common_representation(recipe) for recipe in recipes]
+
+    def get_common_representation(self, recipe):
+        """Представление рецепта, одинаковое для всех пользователей."""
+        data = super().to_representation(recipe)
+        data['author']['is_subscribed'] = None
+        data['is_favorited'] = None
+        data['is_in_shopping_cart'] = None
+        data['favorites_count'] = None
+        return data
+
+    def add_user_representation(self, recipe, data):
+        """Добавляем в представление данные текущего пользователя
+        и счётчик избранного, который меняется без смены версии рецепта."""
+        data = data.copy()
+        data['author'] = data['author'].copy()
+        data['author']['is_subscribed'] = (
+            self.fields['author'].get_is_subscribed(recipe.author)
+        )
+        data['is_favorited'] = self.get_is_favorited(recipe)
+        data['is_in_shopping_cart'] = self.get_is_in_shopping_cart(recipe)
+        data['favorites_count'] = recipe.favorites_count
+        return data
 
     def get_ingredients(self, recipe):
         """Получаем данные о ингредиентах для рецепта."""
-        ingredients = recipe.ingredients.values(
-            'id', 'name', 'measurement_unit', amount=F('recipe__amount')
-        )
-        return ingredients
+        return [
+            {
+                'id': item.ingredient.id,
+                'name': item.ingredient.name,
+                'measurement_unit': item.ingredient.measurement_unit,
+                'amount': item.amount,
+            }
+            for item in recipe.ingredient.all()
+        ]
 
     def get_is_favorited(self, obj):
-        """Проверяем находится ли рецепт в избранном у пользователя."""
-        user = self.context['request'].user
-        if not user.is_anonymous:
-            return user.favorites.filter(recipe=obj).exists()
+        """Проверяем находится ли рецепт в избранном у пользователя.
+        Значение вычисляется в запросе вьюсета."""
+        return getattr(obj, 'is_favorited', False)
 
     def get_is_in_shopping_cart(self, obj):
-        """Проверяем находится ли рецепт в корзине у пользователя."""
-        user = self.context.get('request').user
-        if not user.is_anonymous:
-            return user.shopping_cart.filter(recipe=obj).exists()
+        """Проверяем находится ли рецепт в корзине у пользователя.
+        Значение вычисляется в запросе вьюсета."""
+        return getattr(obj, 'is_in_shopping_cart', False)
 
     def validate(self, attrs):
         """Проверяем корректность вводных данных."""
-        ingredients = self.initial_data.get('ingredients')
+        if not self.partial or 'ingredients' in self.initial_data:
+            attrs['ingredients'] = self.check_ingredients(
+                self.get_initial_list('ingredients')
+            )
+        if not self.partial or 'tags' in self.initial_data:
+            attrs['tags'] = self.check_tags(self.get_initial_list('tags'))
+        return attrs
+
+    def get_initial_list(self, name):
+        """Получаем список из вводных данных.
+        В multipart запросе список передаётся массивом json
+        или повторяющимися полями, каждое из которых может быть
+        объектом json, например ингредиент."""
+        if not hasattr(self.initial_data, 'getlist'):
+            return self.initial_data.get(name)
+        values = []
+        for value in self.initial_data.getlist(name):
+            if not value.lstrip().startswith(('[', '{')):
+                values.append(value)
+                continue
+            try:
+                value = json.loads(value)
+            except ValueError:
+                raise serializers.ValidationError(
+                    {name: 'Некорректный json'}
+                )
+            if isinstance(value, list):
+                values.extend(value)
+            else:
+                values.append(value)
+        return values
+
+    def check_ingredients(self, ingredients):
+        """Проверяем ингредиенты и загружаем их одним запросом."""
         if not ingredients:
             raise serializers.ValidationError(
                 {'ingredients': 'Для приготовления блюда нужны ингредиенты'}
             )
-        ingredient_set = set()
-        for ingredient_item in ingredients:
-            ingredient = get_object_or_404(Ingredient,
-                                           id=ingredient_item['id'])
-            if ingredient in ingredient_set:
-                raise serializers.ValidationError(
-                    'Ингредиенты не должны повторяться!'
-                )
-            ingredient_set.add(ingredient)
-            amount = int(ingredient_item['amount'])
+        try:
+            amounts = {
+                int(item['id']): int(item['amount']) for item in ingredients
+            }
+        except (KeyError, TypeError, ValueError):
+            raise serializers.ValidationError(
+                {'ingredients': 'Укажите id и количество ингредиентов'}
+            )
+        if len(amounts) != len(ingredients):
+            raise serializers.ValidationError(
+                'Ингредиенты не должны повторяться!'
+            )
+        for amount in amounts.values():
             if amount <= MIN_AMOUNT or amount >= MAX_AMOUNT:
                 raise serializers.ValidationError({
                     'ingredients': ('Количество ингредиентов '
                                     'должно быть в диапазоне от 1 до 31999!')
                 })
-        attrs['ingredients'] = ingredients
-        return attrs
+        found = Ingredient.objects.in_bulk(amounts)
+        if len(found) != len(amounts):
+            raise serializers.ValidationError({
+                'ingredients': 'Ингредиенты не найдены: {}'.format(
+                    ', '.join(map(str, amounts.keys() - found.keys()))
+                )
+            })
+        return [
+            (found[ingredient_id], amount)
+            for ingredient_id, amount in amounts.items()
+        ]
+
+    def check_tags(self, tags):
+        """Проверяем тэги и загружаем их одним запросом."""
+        if not tags:
+            raise serializers.ValidationError(
+                {'tags': 'Укажите хотя бы один тэг'}
+            )
+        try:
+            tag_ids = {int(tag_id) for tag_id in tags}
+        except (TypeError, ValueError):
+            raise serializers.ValidationError(
+                {'tags': 'Тэги указываются по id'}
+            )
+        found = Tag.objects.in_bulk(tag_ids)
+        if len(found) != len(tag_ids):
+            raise serializers.ValidationError({
+                'tags': 'Тэги не найдены: {}'.format(
+                    ', '.join(map(str, tag_ids - found.keys()))
+                )
+            })
+        return list(found.values())
 
     def create_ingredients(self, ingredients, recipe):
         """Добавляем ингредиенты в рецепт."""
         IngredientsAmount.objects.bulk_create(
             [IngredientsAmount(
-                ingredient=Ingredient.objects.get(id=ingredient['id']),
+                ingredient=ingredient,
                 recipe=recipe,
-                amount=ingredient['amount']
-            ) for ingredient in ingredients]
+                amount=amount
+            ) for ingredient, amount in ingredients]
+        )
+
+    def create_tags(self, tags, recipe):
+        """Добавляем тэги в рецепт."""
+        Recipe.tags.through.objects.bulk_create(
+            [Recipe.tags.through(recipe=recipe, tag=tag) for tag in tags]
         )
 
+    @transaction.atomic
     def create(self, validated_data):
         """Создаём рецепт."""
         image = validated_data.pop('image')
         ingredients_data = validated_data.pop('ingredients')
+        tags_data = validated_data.pop('tags')
         recipe = Recipe.objects.create(image=image, **validated_data)
-        tags_data = self.initial_data.get('tags')
-        recipe.tags.set(tags_data)
+        self.create_tags(tags_data, recipe)
         self.create_ingredients(ingredients_data, recipe)
+        self.process_image(recipe)
         return recipe
 
+    def process_image(self, recipe):
+        """Создаём уменьшенные изображения в фоне после сохранения."""
+        if recipe.image:
+            transaction.on_commit(
+                lambda: submit(generate_variants, recipe.id)
+            )
+
+    def update_tags(self, tags, recipe):
+        """Добавляем и удаляем только изменившиеся тэги."""
+        through = Recipe.tags.through
+        current = set(through.objects.filter(recipe=recipe).values_list(
+            'tag_id', flat=True
+        ))
+        new = {tag.id: tag for tag in tags}
+        removed = current - new.keys()
+        added = [tag for tag_id, tag in new.items() if tag_id not in current]
+        if removed:
+            through.objects.filter(recipe=recipe, tag_id__in=removed).delete()
+        if added:
+            self.create_tags(added, recipe)
+        return bool(removed or added)
+
+    def update_ingredients(self, ingredients, recipe):
+        """Добавляем, изменяем и удаляем только изменившиеся ингредиенты."""
+        current = {
+            item.ingredient_id: item
+            for item in IngredientsAmount.objects.filter(recipe=recipe)
+        }
+        new = {ingredient.id: amount for ingredient, amount in ingredients}
+        removed = current.keys() - new.keys()
+        added = [
+            (ingredient, amount) for ingredient, amount in ingredients
+            if ingredient.id not in current
+        ]
+        changed = []
+        for ingredient_id, item in current.items():
+            if ingredient_id in new and item.amount != new[ingredient_id]:
+                item.amount = new[ingredient_id]
+                changed.append(item)
+        if removed:
+            IngredientsAmount.objects.filter(
+                recipe=recipe, ingredient_id__in=removed
+            ).delete()
+        if changed:
+            IngredientsAmount.objects.bulk_update(changed, ('amount',))
+        if added:
+            self.create_ingredients(added, recipe)
+        return bool(removed or changed or added)
+
+    @transaction.atomic
     def update(self, instance, validated_data):
-        """Обновляем рецепт."""
-        instance.image = validated_data.get('image', instance.image)
-        instance.name = validated_data.get('name', instance.name)
-        instance.text = validated_data.get('text', instance.text)
-        instance.cooking_time = validated_data.get(
-            'cooking_time', instance.cooking_time
-        )
-        instance.tags.clear()
-        tags_data = self.initial_data.get('tags')
-        instance.tags.set(tags_data)
-        IngredientsAmount.objects.filter(recipe=instance).delete()
-        self.create_ingredients(validated_data.get('ingredients'), instance)
-        instance.save()
+        """Обновляем рецепт, изменяя только то, что действительно
+        изменилось. Неизменённый рецепт не сохраняется,
+        поэтому его версия и кэш остаются прежними."""
+        changed = False
+        for field in ('image', 'name', 'text', 'cooking_time'):
+            if (
+                field in validated_data
+                and validated_data[field] != getattr(instance, field)
+            ):
+                setattr(instance, field, validated_data[field])
+                changed = True
+        if 'tags' in validated_data:
+            changed |= self.update_tags(validated_data['tags'], instance)
+        if 'ingredients' in validated_data:
+            changed |= self.update_ingredients(
+                validated_data['ingredients'], instance
+            )
+        if changed:
+            instance.save()
+        if 'image' in validated_data:
+            Recipe.objects.filter(id=instance.id).update(
+                has_image_variants=False
+            )
+            instance.has_image_variants = False
+            self.process_image(instance)
         return instance
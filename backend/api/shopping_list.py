@@ -0,0 +1,259 @@
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import suppress
+from hashlib import sha1
+from uuid import uuid4
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db.models import Sum
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from recipes.models import IngredientsAmount, ShoppingCart
+from .tasks import submit
+
+User = get_user_model()
+
+FONT_NAME = 'FreeSans'
+FONT_PATH = os.path.join(settings.BASE_DIR, 'data', 'FreeSans.ttf')
+BEGIN_POSITION_X = 40
+BEGIN_POSITION_Y = 750
+POSITION_Y = 790
+BOTTOM_POSITION_Y = 50
+SPACING = 30
+FONT_SIZE = 11
+FONT_SIZE_HEADER = 14
+JOB_PENDING = '.part'
+JOB_DONE = '.pdf'
+JOB_FAILED = '.failed'
+JOB_STATUSES = {
+    JOB_DONE: 'done',
+    JOB_FAILED: 'failed',
+    JOB_PENDING: 'pending',
+}
+
+font_lock = threading.Lock()
+
+
+def register_fonts():
+    """Регистрируем шрифт один раз за процесс."""
+    with font_lock:
+        if FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(TTFont(FONT_NAME, FONT_PATH))
+
+
+def get_shopping_list(user):
+    """Суммируем ингредиенты всех рецептов из корзины пользователя."""
+    return IngredientsAmount.objects.filter(
+        recipe__shopping_cart__user=user
+    ).values(
+        'ingredient__name', 'ingredient__measurement_unit'
+    ).annotate(
+        amount=Sum('amount')
+    ).order_by('ingredient__name', 'ingredient__measurement_unit')
+
+
+def format_item(item):
+    """Строка списка покупок для одного ингредиента."""
+    return (
+        f'{item["ingredient__name"].capitalize()} - '
+        f'{item["amount"]} '
+        f'{item["ingredient__measurement_unit"]}.'
+    )
+
+
+def iter_text(items):
+    """Список покупок в виде простого текста."""
+    for item in items:
+        yield f'{format_item(item)}\n'
+
+
+class Echo:
+    """Файл, возвращающий записанную строку, для потокового csv."""
+    def write(self, value):
+        return value
+
+
+def iter_csv(items):
+    """Список покупок в формате csv."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for item in items:
+        yield writer.writerow((
+            item['ingredient__name'],
+            item['ingredient__measurement_unit'],
+            item['amount'],
+        ))
+
+
+def iter_json(items):
+    """Список покупок в формате json."""
+    yield '['
+    for number, item in enumerate(items):
+        yield ',' if number else ''
+        yield json.dumps({
+            'name': item['ingredient__name'],
+            'measurement_unit': item['ingredient__measurement_unit'],
+            'amount': item['amount'],
+        }, ensure_ascii=False)
+    yield ']'
+
+
+STREAMS = {
+    'txt': iter_text,
+    'csv': iter_csv,
+    'json': iter_json,
+}
+
+
+def stream_shopping_list(user, format):
+    """Потоково отдаём список покупок в текстовом формате."""
+    return STREAMS[format](get_shopping_list(user).iterator())
+
+
+class ShoppingListPDF:
+    """Отрисовка списка покупок в PDF.
+    Положение строки хранится в экземпляре, поэтому каждый запрос
+    рисует свой документ независимо от других."""
+    def __init__(self, file, title):
+        register_fonts()
+        self.canvas = canvas.Canvas(file, pagesize=A4)
+        self.canvas.setTitle('Список покупок')
+        self.title = title
+        self.position_y = None
+
+    def new_page(self):
+        """Начинаем новую страницу с заголовком."""
+        if self.position_y is not None:
+            self.canvas.showPage()
+        self.canvas.setFont(FONT_NAME, FONT_SIZE_HEADER)
+        self.canvas.drawString(BEGIN_POSITION_X, POSITION_Y, self.title)
+        self.canvas.setFont(FONT_NAME, FONT_SIZE)
+        self.position_y = BEGIN_POSITION_Y
+
+    def draw_line(self, text):
+        """Рисуем строку, перенося её на новую страницу при нехватке места."""
+        if self.position_y is None or self.position_y < BOTTOM_POSITION_Y:
+            self.new_page()
+        self.canvas.drawString(BEGIN_POSITION_X, self.position_y, text)
+        self.position_y -= SPACING
+
+    def render(self, items):
+        """Рисуем список покупок и сохраняем документ."""
+        for item in items:
+            self.draw_line(format_item(item))
+        if self.position_y is None:
+            self.new_page()
+        self.canvas.showPage()
+        self.canvas.save()
+
+
+def render_pdf(user):
+    """Рисуем список покупок пользователя во временный файл."""
+    file = tempfile.TemporaryFile()
+    ShoppingListPDF(
+        file, f'Список покупок для {user.get_full_name()}:'
+    ).render(get_shopping_list(user).iterator())
+    file.seek(0)
+    return file
+
+
+def get_cart_version(user):
+    """Версия корзины пользователя.
+    Меняется при добавлении и удалении рецептов из корзины
+    и при изменении самих рецептов."""
+    cart = ShoppingCart.objects.filter(user=user).order_by(
+        'recipe_id'
+    ).values_list('recipe_id', 'recipe__version')
+    state = f'{user.get_full_name()}:{list(cart)}'
+    return sha1(state.encode()).hexdigest()
+
+
+def get_cached_pdf(user, version):
+    """Получаем список покупок текущей версии из кэша документов."""
+    cached = caches['documents'].get(f'shopping-list:{user.id}')
+    if cached and cached[0] == version:
+        return io.BytesIO(cached[1])
+    return None
+
+
+def get_pdf(user, version):
+    """Получаем список покупок из кэша документов или рисуем заново.
+    Слишком большие документы в кэш не попадают."""
+    cached = get_cached_pdf(user, version)
+    if cached is not None:
+        return cached
+    file = render_pdf(user)
+    if file.seek(0, os.SEEK_END) <= settings.SHOPPING_LIST_CACHE_MAX_SIZE:
+        file.seek(0)
+        caches['documents'].set(
+            f'shopping-list:{user.id}', (version, file.read())
+        )
+    file.seek(0)
+    return file
+
+
+def is_large(user):
+    """Проверяем, нужно ли рисовать список покупок в фоне."""
+    threshold = settings.SHOPPING_LIST_ASYNC_THRESHOLD
+    return bool(threshold) and get_shopping_list(user).count() >= threshold
+
+
+def get_job_path(job_id, suffix):
+    return os.path.join(settings.SHOPPING_LIST_JOBS_DIR, f'{job_id}{suffix}')
+
+
+def remove_expired_jobs():
+    """Удаляем файлы задач старше SHOPPING_LIST_JOB_TIMEOUT."""
+    expired = time.time() - settings.SHOPPING_LIST_JOB_TIMEOUT
+    with os.scandir(settings.SHOPPING_LIST_JOBS_DIR) as entries:
+        for entry in entries:
+            if entry.stat().st_mtime < expired:
+                with suppress(FileNotFoundError):
+                    os.remove(entry.path)
+
+
+def start_pdf_job(user, version):
+    """Ставим отрисовку списка покупок в очередь фоновых задач.
+    Состояние задачи хранится в файлах, поэтому его видят
+    все процессы сервера."""
+    os.makedirs(settings.SHOPPING_LIST_JOBS_DIR, exist_ok=True)
+    remove_expired_jobs()
+    job_id = f'{user.id}-{uuid4().hex}'
+    open(get_job_path(job_id, JOB_PENDING), 'wb').close()
+    submit(run_pdf_job, job_id, user.id, version)
+    return job_id
+
+
+def run_pdf_job(job_id, user_id, version):
+    """Рисуем список покупок в файл задачи."""
+    pending = get_job_path(job_id, JOB_PENDING)
+    try:
+        user = User.objects.get(id=user_id)
+        with get_pdf(user, version) as source, open(pending, 'wb') as file:
+            shutil.copyfileobj(source, file)
+        os.replace(pending, get_job_path(job_id, JOB_DONE))
+    except Exception:
+        os.replace(pending, get_job_path(job_id, JOB_FAILED))
+        raise
+
+
+def get_job(user, job_id):
+    """Получаем состояние задачи пользователя и путь к готовому файлу."""
+    if not job_id.startswith(f'{user.id}-'):
+        return None, None
+    for suffix, status in JOB_STATUSES.items():
+        path = get_job_path(job_id, suffix)
+        if os.path.exists(path):
+            return status, path
+    return None, None
@@ -0,0 +1,33 @@
+from django.contrib.auth import get_user_model
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.models import Ingredient, Recipe, Tag
+from .cache import INGREDIENTS, TAGS, touch_on_commit
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+def update_author_recipes_version(sender, instance, created,
+                                  update_fields, **kwargs):
+    """Сбрасываем кэш рецептов при изменении профиля автора.
+    Обновление даты последнего входа профиль не меняет."""
+    if created or (update_fields and set(update_fields) <= {'last_login'}):
+        return
+    Recipe.objects.filter(author=instance).update(version=F('version') + 1)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def update_ingredients_stamp(sender, **kwargs):
+    """Отмечаем изменение списка ингредиентов."""
+    touch_on_commit(INGREDIENTS)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def update_tags_stamp(sender, **kwargs):
+    """Отмечаем изменение списка тэгов."""
+    touch_on_commit(TAGS)
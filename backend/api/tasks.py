@@ -0,0 +1,55 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+def run_task(func, *args):
+    """Выполняем задачу и закрываем соединение потока с базой."""
+    try:
+        func(*args)
+    except Exception:
+        logger.exception('Фоновая задача %s завершилась ошибкой', func)
+    finally:
+        connection.close()
+
+
+class ThreadBackend:
+    """Выполнение задач в пуле потоков процесса."""
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(
+            max_workers=settings.BACKGROUND_TASK_WORKERS,
+            thread_name_prefix='foodgram-task'
+        )
+
+    def submit(self, func, *args):
+        self.executor.submit(run_task, func, *args)
+
+
+class SyncBackend:
+    """Выполнение задач сразу в текущем потоке."""
+    def submit(self, func, *args):
+        func(*args)
+
+
+backend = None
+backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Создаём исполнитель задач из настройки BACKGROUND_TASK_BACKEND."""
+    global backend
+    with backend_lock:
+        if backend is None:
+            backend = import_string(settings.BACKGROUND_TASK_BACKEND)()
+    return backend
+
+
+def submit(func, *args):
+    """Ставим задачу в очередь фонового исполнителя."""
+    get_backend().submit(func, *args)
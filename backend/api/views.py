@@ -1,40 +1,45 @@
-import io
+from functools import partial
 
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
-from django.http import FileResponse
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Window
+from django.db.models.functions import RowNumber
+from django.http import FileResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfgen import canvas
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.parsers import JSONParser
 from rest_framework.permissions import (AllowAny, IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
 from rest_framework.response import Response
+from foodgram.counters import change_counter
 from users.models import Subscribe
 
-from recipes.models import (Favorite, Ingredient, IngredientsAmount, Recipe,
-                            ShoppingCart, Tag)
-from .filters import FilterIngredient, FilterRecipe
-from .pagination import PageLimitPagination
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from .cache import INGREDIENTS, TAGS
+from .catalogs import Catalog, CatalogMixin
+from .feed import (backfill, fan_out, get_feed, on_recipe_deleted,
+                   remove)
+from .filters import FilterRecipe
+from .pagination import PageLimitPagination, RecipePagination
+from .parsers import RecipeMultiPartParser
 from .permissions import IsAuthorOrReadOnly
+from .renderers import SHOPPING_LIST_RENDERERS
+from .search import ingredient_index
 from .serializers import (CustomUserSerializer, IngredientSerializer,
                           RecipeSerializer, RecipeShortSerializer,
                           SubscribeSerializer, TagSerializer)
+from .shopping_list import (get_cart_version, get_cached_pdf, get_job,
+                            get_pdf, is_large, start_pdf_job,
+                            stream_shopping_list)
+from .tasks import submit
 
 User = get_user_model()
 
-BEGIN_POSITION_X = 40
-BEGIN_POSITION_Y = 750
-POSITION_Y = 790
-SPACING = 30
-FONT_SIZE = 11
-FONT_SIZE_HEADER = 14
-
 
 class CustomUserViewSet(UserViewSet):
     """Кастомный вьюсет для работы с пользователем."""
@@ -49,6 +54,52 @@ class CustomUserViewSet(UserViewSet):
             self.permission_classes = (IsAuthenticated,)
         return super().get_permissions()
 
+    def get_recipes_limit(self):
+        """Получаем из запроса ограничение на количество рецептов автора."""
+        params = self.request.query_params
+        recipes_limit = params.get(
+            'recipes_limit', params.get('recipe_limit')
+        )
+        try:
+            return int(recipes_limit)
+        except (TypeError, ValueError):
+            return None
+
+    def get_recipes_by_author(self, authors):
+        """Получаем первые рецепты каждого автора одним запросом.
+        Рецепты нумеруются внутри автора оконной функцией ROW_NUMBER."""
+        if not authors:
+            return {}
+        recipes_limit = self.get_recipes_limit()
+        recipes = Recipe.objects.filter(author__in=authors)
+        if recipes_limit is not None:
+            ranked = recipes.annotate(row_number=Window(
+                expression=RowNumber(),
+                partition_by=[F('author_id')],
+                order_by=[F('pub_date').desc(), F('id').desc()],
+            ))
+            sql, params = ranked.query.sql_with_params()
+            recipes = Recipe.objects.raw(
+                f'SELECT * FROM ({sql}) AS ranked '
+                f'WHERE ranked.row_number <= %s '
+                f'ORDER BY ranked.row_number',
+                (*params, recipes_limit)
+            )
+        recipes_by_author = {author.id: [] for author in authors}
+        for recipe in recipes:
+            recipes_by_author[recipe.author_id].append(recipe)
+        return recipes_by_author
+
+    def get_subscribe_serializer(self, authors, many=False):
+        """Сериализатор подписок с заранее загруженными рецептами."""
+        context = {
+            'request': self.request,
+            'recipes': self.get_recipes_by_author(
+                authors if many else [authors]
+            ),
+        }
+        return SubscribeSerializer(authors, many=many, context=context)
+
     @action(
         methods=['POST', 'DELETE'],
         detail=True,
@@ -57,6 +108,7 @@ class CustomUserViewSet(UserViewSet):
         """Создаем или удаляем подписку на автора."""
         user = request.user
         author = get_object_or_404(User, id=id)
+        followers = User.objects.filter(id=author.id)
         subscription = Subscribe.objects.filter(user=user, author=author)
 
         if request.method == 'POST':
@@ -70,15 +122,19 @@ class CustomUserViewSet(UserViewSet):
                     {'error': 'Невозможно подписаться на себя'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            serializer = SubscribeSerializer(
-                author, context={'request': request}
-            )
-            Subscribe.objects.create(user=user, author=author)
+            with transaction.atomic():
+                Subscribe.objects.create(user=user, author=author)
+                change_counter(followers, 'followers_count', 1)
+                backfill(user, author)
+            serializer = self.get_subscribe_serializer(author)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         if request.method == 'DELETE':
-            if subscription.exists():
-                subscription.delete()
+            with transaction.atomic():
+                deleted, _ = subscription.delete()
+                change_counter(followers, 'followers_count', -deleted)
+                remove(user, author)
+            if deleted:
                 return Response(status=status.HTTP_204_NO_CONTENT)
             return Response(
                 {'error': 'Вы не подписаны на этого пользователя'},
@@ -91,48 +147,98 @@ class CustomUserViewSet(UserViewSet):
         user = request.user
         follows = User.objects.filter(following__user=user)
         page = self.paginate_queryset(follows)
-        serializer = SubscribeSerializer(
-            page, many=True, context={'request': request}
-        )
+        serializer = self.get_subscribe_serializer(page, many=True)
         return self.get_paginated_response(serializer.data)
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(CatalogMixin, viewsets.ReadOnlyModelViewSet):
     """Вьюсет для ингредиентов."""
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (AllowAny,)
-    filter_backends = (DjangoFilterBackend,)
-    filterset_class = FilterIngredient
     pagination_class = None
+    catalog = Catalog(INGREDIENTS, queryset, serializer_class)
 
+    def list(self, request, *args, **kwargs):
+        """Поиск по названию выполняем в индексе без обращения к базе."""
+        name = request.query_params.get('name')
+        if name:
+            return Response(ingredient_index.search(name))
+        return super().list(request, *args, **kwargs)
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+
+class TagViewSet(CatalogMixin, viewsets.ReadOnlyModelViewSet):
     """Вьюсет для тэгов."""
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (AllowAny,)
     pagination_class = None
+    catalog = Catalog(TAGS, queryset, serializer_class)
 
 
 class RecipeViewSet(viewsets.ModelViewSet):
     """Вьюсет для рецептов."""
     queryset = Recipe.objects.all()
-    pagination_class = PageLimitPagination
+    pagination_class = RecipePagination
     serializer_class = RecipeSerializer
     permission_classes = (IsAuthorOrReadOnly,)
     add_serializer = RecipeShortSerializer
+    parser_classes = (JSONParser, RecipeMultiPartParser)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = FilterRecipe
 
+    def get_queryset(self):
+        """Загружаем автора вместе с рецептом. Тэги и ингредиенты
+        сериализатор загружает только для рецептов, которых нет в кэше.
+        Избранное и корзину пользователя отмечаем прямо в запросе,
+        чтобы не проверять каждый рецепт отдельно."""
+        queryset = super().get_queryset().select_related('author')
+        user = self.request.user
+        if user.is_anonymous:
+            return queryset
+        return queryset.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+        )
+
+    def get_serializer_context(self):
+        """В списке рецептов отдаём изображения для карточек."""
+        context = super().get_serializer_context()
+        context['image_variant'] = (
+            'card' if self.action in ('list', 'feed') else 'full'
+        )
+        return context
+
     def perform_create(self, serializer):
-        """При создании рецепта указываем автором текущего пользоваетля."""
-        serializer.save(author=self.request.user)
+        """При создании рецепта указываем автором текущего пользоваетля.
+        В ленты подписчиков рецепт добавляется в фоне."""
+        user = self.request.user
+        with transaction.atomic():
+            recipe = serializer.save(author=user)
+            change_counter(
+                User.objects.filter(id=user.id), 'recipes_count', 1
+            )
+            transaction.on_commit(lambda: submit(fan_out, recipe.id))
 
-    def to_add_or_delete(self, model, pk):
-        """Метод создания или удаления связи."""
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        author_id = instance.author_id
+        instance.delete()
+        change_counter(
+            User.objects.filter(id=author_id), 'recipes_count', -1
+        )
+        on_recipe_deleted(author_id)
+
+    def to_add_or_delete(self, model, pk, counter):
+        """Метод создания или удаления связи.
+        Вместе со связью изменяем счётчик рецепта."""
         recipe = get_object_or_404(Recipe, pk=pk)
         user = self.request.user
+        recipes = Recipe.objects.filter(id=pk)
 
         if self.request.method == 'POST':
             if model.objects.filter(user=user, recipe__id=pk).exists():
@@ -140,80 +246,122 @@ class RecipeViewSet(viewsets.ModelViewSet):
                     {'errors': 'Рецепт уже добавлен!'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            recipe = get_object_or_404(Recipe, id=pk)
-            model.objects.create(user=user, recipe=recipe)
+            with transaction.atomic():
+                model.objects.create(user=user, recipe=recipe)
+                change_counter(recipes, counter, 1)
             serializer = RecipeShortSerializer(recipe)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         if self.request.method == 'DELETE':
-            obj = model.objects.filter(user=user, recipe__id=pk)
-            if obj.exists():
-                obj.delete()
+            with transaction.atomic():
+                deleted, _ = model.objects.filter(
+                    user=user, recipe__id=pk
+                ).delete()
+                change_counter(recipes, counter, -deleted)
+            if deleted:
                 return Response(status=status.HTTP_204_NO_CONTENT)
             return Response(
                 {'errors': 'Рецепт уже удален!'},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+    @action(detail=False, permission_classes=[IsAuthenticated])
+    def feed(self, request):
+        """Лента рецептов авторов, на которых подписан пользователь."""
+        recipes = self.paginator.paginate_keyset(
+            partial(get_feed, request.user, self.get_queryset()), request
+        )
+        serializer = self.get_serializer(recipes, many=True)
+        return self.paginator.get_paginated_response(serializer.data)
+
     @action(methods=['POST', 'DELETE'], detail=True, pagination_class=None)
     def favorite(self, request, pk):
         """Добавляем рецепт в избранное."""
-        return self.to_add_or_delete(Favorite, pk)
+        return self.to_add_or_delete(Favorite, pk, 'favorites_count')
 
     @action(methods=['POST', 'DELETE'], detail=True, pagination_class=None)
     def shopping_cart(self, request, pk):
         """Добавляем рецепт в корзину."""
-        return self.to_add_or_delete(ShoppingCart, pk)
+        return self.to_add_or_delete(ShoppingCart, pk, 'in_carts_count')
 
     @action(
         detail=False,
-        permission_classes=[IsAuthenticated]
+        permission_classes=[IsAuthenticated],
+        renderer_classes=SHOPPING_LIST_RENDERERS
     )
     def download_shopping_cart(self, request):
-        """Скачиваем pdf файл со списком ингредиентов из корзины."""
-        global BEGIN_POSITION_Y
-        buffer = io.BytesIO()
-        shopping_cart = IngredientsAmount.objects.filter(
-            recipe__shopping_cart__user=request.user
-        ).values(
-            'ingredient__name', 'ingredient__measurement_unit'
-        ).annotate(amount=Sum('amount'))
-        ingredients = {}
-        for recipe in shopping_cart:
-            name = recipe['ingredient__name']
-            amount = recipe['amount']
-            measurement_unit = recipe['ingredient__measurement_unit']
-            if name in ingredients:
-                ingredients[name]['amount'] = (
-                    ingredients[name]['amount'] + amount
-                )
-            else:
-                ingredients[name] = {
-                    'measurement_unit': measurement_unit,
-                    'amount': amount,
-                }
-        page = canvas.Canvas(buffer, pagesize=A4)
-        pdfmetrics.registerFont(TTFont('FreeSans', 'data/FreeSans.ttf'))
-        page.setFont('FreeSans', FONT_SIZE_HEADER)
-        page.setTitle('Список покупок')
-        page.drawString(
-            BEGIN_POSITION_X,
-            POSITION_Y,
-            f'Список покупок для {request.user.get_full_name()}:'
+        """Скачиваем файл со списком ингредиентов из корзины.
+        По умолчанию отдаём pdf, формат txt, csv или json выбирается
+        параметром format или заголовком Accept."""
+        renderer = request.accepted_renderer
+        if renderer.format != 'pdf':
+            response = StreamingHttpResponse(
+                stream_shopping_list(request.user, renderer.format),
+                content_type=f'{renderer.media_type}; charset=utf-8'
+            )
+            response['Content-Disposition'] = (
+                f'attachment; filename="shopping-list.{renderer.format}"'
+            )
+            return response
+        if request.query_params.get('async') or is_large(request.user):
+            return self.start_pdf_job(request)
+        return self.download_pdf(request)
+
+    def start_pdf_job(self, request):
+        """Ставим отрисовку pdf в фоновую очередь и возвращаем
+        ссылку для проверки состояния задачи."""
+        version = get_cart_version(request.user)
+        if get_cached_pdf(request.user, version) is not None:
+            return self.download_pdf(request)
+        job_id = start_pdf_job(request.user, version)
+        url = request.build_absolute_uri(
+            reverse('recipe-shopping-list-job', args=(job_id,))
+        )
+        response = Response(
+            {'id': job_id, 'status': 'pending', 'url': url},
+            status=status.HTTP_202_ACCEPTED
         )
-        page.setFont('FreeSans', FONT_SIZE)
-        for key, values in ingredients.items():
-            page.drawString(
-                BEGIN_POSITION_X,
-                BEGIN_POSITION_Y,
-                f'{key.capitalize()} - '
-                f'{values["amount"]} '
-                f'{values["measurement_unit"]}.'
+        response['Location'] = url
+        return response
+
+    def download_pdf(self, request):
+        """Неизменившийся pdf отдаём из кэша или отвечаем 304."""
+        version = get_cart_version(request.user)
+        etag = f'"{version}"'
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = FileResponse(
+                get_pdf(request.user, version),
+                as_attachment=True,
+                filename='shopping-list.pdf'
+            )
+        response['ETag'] = etag
+        return response
+
+    @action(
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        url_path=r'download_shopping_cart/(?P<job_id>[\w-]+)',
+        url_name='shopping-list-job'
+    )
+    def shopping_list_job(self, request, job_id):
+        """Проверяем состояние фоновой отрисовки и скачиваем готовый pdf."""
+        job_status, path = get_job(request.user, job_id)
+        if job_status is None:
+            return Response(
+                {'errors': 'Задача не найдена'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        if job_status == 'done':
+            return FileResponse(
+                open(path, 'rb'),
+                as_attachment=True,
+                filename='shopping-list.pdf'
+            )
+        return Response(
+            {'id': job_id, 'status': job_status},
+            status=(
+                status.HTTP_202_ACCEPTED if job_status == 'pending'
+                else status.HTTP_500_INTERNAL_SERVER_ERROR
             )
-            BEGIN_POSITION_Y -= SPACING
-        page.showPage()
-        page.save()
-        buffer.seek(0)
-        return FileResponse(
-            buffer, as_attachment=True, filename='shopping-list.pdf'
         )
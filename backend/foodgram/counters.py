@@ -0,0 +1,30 @@
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+
+class CountersMixin:
+    """Модель со счётчиками, которые обновляются только запросами update.
+    При сохранении объекта счётчики не перезаписываются,
+    чтобы не затереть изменения из параллельных запросов."""
+    counter_fields = ()
+    update_only_fields = ()
+
+    def get_saved_fields(self):
+        """Поля, которые записываются при обычном сохранении объекта."""
+        excluded = {*self.counter_fields, *self.update_only_fields}
+        return [
+            field.name for field in self._meta.concrete_fields
+            if not field.primary_key and field.name not in excluded
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = self.get_saved_fields()
+        super().save(*args, **kwargs)
+
+
+def change_counter(queryset, field, delta):
+    """Изменяем счётчик атомарно на стороне базы данных.
+    Счётчик не опускается ниже нуля, расхождение исправит recount."""
+    if delta:
+        queryset.update(**{field: Greatest(F(field) + delta, 0)})
@@ -0,0 +1,109 @@
+import heapq
+import logging
+from time import perf_counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+logger = logging.getLogger('foodgram.timing')
+
+
+class RequestTiming:
+    """Счётчики одного запроса."""
+    def __init__(self):
+        self.started = perf_counter()
+        self.queries = 0
+        self.db_time = 0
+        self.view_started = None
+        self.render_started = None
+        self.render_finished = None
+        self.slowest = []
+
+    def record_query(self, execute, sql, params, many, context):
+        """Обёртка запросов к базе: считаем их число и время.
+        Храним только несколько самых медленных запросов."""
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = perf_counter() - started
+            self.queries += 1
+            self.db_time += duration
+            item = (duration, self.queries, sql)
+            if len(self.slowest) < settings.REQUEST_TIMING_SLOW_QUERIES:
+                heapq.heappush(self.slowest, item)
+            else:
+                heapq.heappushpop(self.slowest, item)
+
+    def get_metrics(self):
+        """Длительности в миллисекундах."""
+        finished = perf_counter()
+        metrics = {
+            'db': self.db_time,
+            'total': finished - self.started,
+        }
+        if self.view_started is not None:
+            metrics['view'] = (
+                (self.render_started or finished) - self.view_started
+            )
+        if self.render_started is not None:
+            metrics['render'] = (
+                (self.render_finished or finished) - self.render_started
+            )
+        return {name: value * 1000 for name, value in metrics.items()}
+
+
+class RequestTimingMiddleware:
+    """Замеряем число запросов к базе, время базы, представления,
+    отрисовки ответа и общее время запроса.
+    Результат отдаём в заголовке Server-Timing и пишем в лог.
+    Включается настройкой REQUEST_TIMING."""
+    def __init__(self, get_response):
+        if not settings.REQUEST_TIMING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timing = request.timing = RequestTiming()
+        with connection.execute_wrapper(timing.record_query):
+            response = self.get_response(request)
+        metrics = timing.get_metrics()
+        response['Server-Timing'] = ', '.join(
+            f'{name};dur={value:.1f}' for name, value in metrics.items()
+        ) + f', queries;desc="{timing.queries}"'
+        logger.info(
+            'method=%s path=%s status=%s queries=%s %s',
+            request.method,
+            request.path,
+            response.status_code,
+            timing.queries,
+            ' '.join(
+                f'{name}_ms={value:.1f}' for name, value in metrics.items()
+            )
+        )
+        if metrics['total'] >= settings.REQUEST_TIMING_SLOW_MS:
+            self.log_slow_queries(request, timing)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.timing.view_started = perf_counter()
+
+    def process_template_response(self, request, response):
+        """Ответы DRF отрисовываются после выхода из представления."""
+        timing = request.timing
+        timing.render_started = perf_counter()
+        response.add_post_render_callback(
+            lambda response: setattr(
+                timing, 'render_finished', perf_counter()
+            )
+        )
+        return response
+
+    @staticmethod
+    def log_slow_queries(request, timing):
+        for duration, number, sql in sorted(timing.slowest, reverse=True):
+            logger.warning(
+                'slow request path=%s query=%s duration_ms=%.1f sql=%s',
+                request.path, number, duration * 1000, sql
+            )
@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 from django.core.management.utils import get_random_secret_key
 from dotenv import load_dotenv
@@ -40,6 +41,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'foodgram.middleware.RequestTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -49,6 +51,14 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+REQUEST_TIMING = os.getenv('REQUEST_TIMING', default='False') == 'True'
+
+REQUEST_TIMING_SLOW_MS = int(os.getenv('REQUEST_TIMING_SLOW_MS', default=500))
+
+REQUEST_TIMING_SLOW_QUERIES = int(
+    os.getenv('REQUEST_TIMING_SLOW_QUERIES', default=5)
+)
+
 ROOT_URLCONF = 'foodgram.urls'
 
 TEMPLATES = [
@@ -85,6 +95,77 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default=''),
+    },
+    'documents': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'documents',
+        'TIMEOUT': int(os.getenv('DOCUMENTS_CACHE_TIMEOUT', default=600)),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(
+                os.getenv('DOCUMENTS_CACHE_MAX_ENTRIES', default=100)
+            ),
+        },
+    },
+}
+
+RECIPE_CACHE_TIMEOUT = int(os.getenv('RECIPE_CACHE_TIMEOUT', default=3600))
+
+PAGINATION_COUNT_CACHE_TIMEOUT = int(
+    os.getenv('PAGINATION_COUNT_CACHE_TIMEOUT', default=60)
+)
+
+PAGINATION_COUNT_CACHE_MIN = int(
+    os.getenv('PAGINATION_COUNT_CACHE_MIN', default=1000)
+)
+
+PAGINATION_COUNT_ESTIMATE_MIN = int(
+    os.getenv('PAGINATION_COUNT_ESTIMATE_MIN', default=100000)
+)
+
+PAGINATION_COUNT_LARGE_TIMEOUT = int(
+    os.getenv('PAGINATION_COUNT_LARGE_TIMEOUT', default=24 * 60 * 60)
+)
+
+FEED_MAX_AUTHOR_RECIPES = int(
+    os.getenv('FEED_MAX_AUTHOR_RECIPES', default=500)
+)
+
+STAMP_CHECK_INTERVAL = int(os.getenv('STAMP_CHECK_INTERVAL', default=5))
+
+SHOPPING_LIST_CACHE_MAX_SIZE = int(
+    os.getenv('SHOPPING_LIST_CACHE_MAX_SIZE', default=1024 * 1024)
+)
+
+SHOPPING_LIST_ASYNC_THRESHOLD = int(
+    os.getenv('SHOPPING_LIST_ASYNC_THRESHOLD', default=0)
+)
+
+SHOPPING_LIST_JOBS_DIR = os.getenv(
+    'SHOPPING_LIST_JOBS_DIR',
+    default=os.path.join(tempfile.gettempdir(), 'foodgram-shopping-lists')
+)
+
+SHOPPING_LIST_JOB_TIMEOUT = int(
+    os.getenv('SHOPPING_LIST_JOB_TIMEOUT', default=3600)
+)
+
+BACKGROUND_TASK_BACKEND = os.getenv(
+    'BACKGROUND_TASK_BACKEND', default='api.tasks.ThreadBackend'
+)
+
+BACKGROUND_TASK_WORKERS = int(os.getenv('BACKGROUND_TASK_WORKERS', default=2))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -122,6 +203,16 @@ MEDIA_URL = '/media/'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+RECIPE_IMAGE_FORMAT = os.getenv('RECIPE_IMAGE_FORMAT', default='WEBP')
+
+RECIPE_IMAGE_QUALITY = int(os.getenv('RECIPE_IMAGE_QUALITY', default=80))
+
+RECIPE_IMAGE_MAX_SIZE = int(
+    os.getenv('RECIPE_IMAGE_MAX_SIZE', default=5 * 1024 * 1024)
+)
+
+RECIPE_UPLOAD_MAX_SIZE = RECIPE_IMAGE_MAX_SIZE + 64 * 1024
+
 AUTH_USER_MODEL = 'users.User'
 
 REST_FRAMEWORK = {
@@ -148,3 +239,20 @@ DJOSER = {
         'current_user': 'api.serializers.CustomUserSerializer',
     },
 }
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'foodgram.timing': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
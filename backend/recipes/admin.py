@@ -29,34 +29,54 @@ class TagAdmin(ModelAdmin):
 
 class IngredientAmountInline(TabularInline):
     model = IngredientsAmount
+    autocomplete_fields = ("ingredient",)
 
 
 @register(Recipe)
 class RecipeAdmin(ModelAdmin):
     list_display = ("pk", "name", "author", "image", "favorites")
+    list_select_related = ("author",)
     exclude = ("ingredients",)
     inlines = (IngredientAmountInline,)
-    list_filter = ("author", "name", "tags")
-    search_fields = ("author__username", "name", "tags__name")
+    autocomplete_fields = ("author",)
+    list_filter = ("tags",)
+    search_fields = ("name", "author__username")
+    show_full_result_count = False
+
+    def save_related(self, request, form, formsets, change):
+        """Ингредиенты сохраняются после рецепта,
+        поэтому ещё раз обновляем версию рецепта."""
+        super().save_related(request, form, formsets, change)
+        form.instance.save(update_fields=('version',))
 
     def favorites(self, obj):
-        return obj.favorites.count()
+        return obj.favorites_count
 
     favorites.short_description = 'Добавлен в избранное'
+    favorites.admin_order_field = 'favorites_count'
 
 
 @register(IngredientsAmount)
 class IngredientsAmountAdmin(ModelAdmin):
     list_display = ("id", "recipe", "ingredient", "amount")
+    list_select_related = ("recipe", "ingredient")
+    autocomplete_fields = ("recipe", "ingredient")
     search_fields = ("recipe__name", "ingredient__name")
+    show_full_result_count = False
     min_num = 1
 
 
 @register(Favorite)
 class FavoriteAdmin(ModelAdmin):
     list_display = ("recipe", "user")
+    list_select_related = ("recipe", "user")
+    autocomplete_fields = ("recipe", "user")
+    show_full_result_count = False
 
 
 @register(ShoppingCart)
 class ShoppingCartAdmin(ModelAdmin):
     list_display = ("recipe", "user")
+    list_select_related = ("recipe", "user")
+    autocomplete_fields = ("recipe", "user")
+    show_full_result_count = False
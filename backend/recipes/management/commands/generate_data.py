@@ -0,0 +1,268 @@
+import random
+import time
+from contextlib import contextmanager
+from collections import defaultdict
+from datetime import timedelta
+from itertools import accumulate, islice
+
+from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from recipes.models import (Favorite, FeedItem, Ingredient, IngredientsAmount,
+                            Recipe, ShoppingCart, Tag)
+from users.models import Subscribe
+
+User = get_user_model()
+
+TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+    ('Десерт', '#F2C94C', 'dessert'),
+    ('Выпечка', '#D9534F', 'bakery'),
+)
+IMAGES = ('recipes/borsh.jpg', 'recipes/kartoha.jpg', 'recipes/tost.jpg')
+PASSWORD = 'password'
+POWER_LAW_ALPHA = 1.2
+BIG_CART_SIZE = (50, 200)
+
+
+@contextmanager
+def manual_pub_date():
+    """Разрешаем задавать дату публикации рецептов при вставке."""
+    field = Recipe._meta.get_field('pub_date')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    """Генерация тестовых данных для нагрузочного тестирования."""
+    help = 'Generates users, recipes, subscriptions, favorites and carts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument(
+            '--ingredients-per-recipe', type=int, default=8,
+            help='Среднее количество ингредиентов в рецепте'
+        )
+        parser.add_argument(
+            '--follows', type=int, default=20,
+            help='Среднее количество подписок пользователя'
+        )
+        parser.add_argument(
+            '--favorites', type=int, default=30,
+            help='Среднее количество избранных рецептов пользователя'
+        )
+        parser.add_argument(
+            '--cart', type=int, default=5,
+            help='Среднее количество рецептов в корзине пользователя'
+        )
+        parser.add_argument(
+            '--big-carts', type=float, default=0.01,
+            help='Доля пользователей с очень большой корзиной'
+        )
+        parser.add_argument('--days', type=int, default=365)
+        parser.add_argument('--prefix', default='bench')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if not Ingredient.objects.exists():
+            raise CommandError('Сначала загрузите ингредиенты: load_data')
+        if User.objects.filter(
+            username__startswith=f'{options["prefix"]}_'
+        ).exists():
+            raise CommandError(
+                f'Данные с префиксом {options["prefix"]} уже созданы'
+            )
+        self.options = options
+        self.random = random.Random(options['seed'])
+        self.started = time.monotonic()
+        with transaction.atomic():
+            user_ids = self.create_users()
+            recipe_ids = self.create_recipes(user_ids)
+            self.create_recipe_relations(recipe_ids)
+            self.create_subscriptions(user_ids)
+            self.create_user_recipes(user_ids, recipe_ids)
+            call_command('recount', stdout=self.stdout)
+            self.create_feed(user_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f'Done in {time.monotonic() - self.started:.1f}s'
+        ))
+
+    def insert(self, model, objects):
+        """Вставляем объекты пачками и сообщаем о прогрессе."""
+        total = 0
+        objects = iter(objects)
+        while True:
+            batch = list(islice(objects, self.options['batch_size']))
+            if not batch:
+                break
+            model.objects.bulk_create(batch)
+            total += len(batch)
+        self.stdout.write(
+            f'{model._meta.verbose_name_plural}: {total} '
+            f'({time.monotonic() - self.started:.1f}s)'
+        )
+
+    def power_law(self, size):
+        """Накопленные веса с распределением Парето."""
+        return list(accumulate(
+            self.random.paretovariate(POWER_LAW_ALPHA) for _ in range(size)
+        ))
+
+    def sample(self, population, cum_weights, size):
+        """Выбираем различные элементы с учётом весов."""
+        size = min(size, len(population))
+        chosen = set()
+        for _ in range(size * 3):
+            chosen.update(self.random.choices(
+                population, cum_weights=cum_weights, k=size - len(chosen)
+            ))
+            if len(chosen) >= size:
+                break
+        return chosen
+
+    def count(self, mean):
+        """Количество связей пользователя с длинным хвостом."""
+        return int(self.random.expovariate(1 / mean)) if mean else 0
+
+    def create_users(self):
+        prefix = self.options['prefix']
+        last_id = User.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+        password = make_password(PASSWORD)
+        self.insert(User, (
+            User(
+                username=f'{prefix}_{number}',
+                email=f'{prefix}_{number}@example.com',
+                first_name=f'Имя{number}',
+                last_name=f'Фамилия{number}',
+                password=password,
+            )
+            for number in range(self.options['users'])
+        ))
+        return list(User.objects.filter(id__gt=last_id).values_list(
+            'id', flat=True
+        ))
+
+    def create_recipes(self, user_ids):
+        """Авторы выбираются по степенному закону:
+        несколько авторов публикуют большую часть рецептов."""
+        last_id = Recipe.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+        now = timezone.now()
+        seconds = self.options['days'] * 24 * 60 * 60
+        authors = self.random.choices(
+            user_ids,
+            cum_weights=self.power_law(len(user_ids)),
+            k=self.options['recipes']
+        )
+        with manual_pub_date():
+            self.insert(Recipe, (
+                Recipe(
+                    author_id=author_id,
+                    name=f'Рецепт {number}',
+                    text=f'Описание рецепта {number}',
+                    image=self.random.choice(IMAGES),
+                    cooking_time=self.random.randint(1, 180),
+                    pub_date=now - timedelta(
+                        seconds=self.random.randint(0, seconds)
+                    ),
+                    version=1,
+                )
+                for number, author_id in enumerate(authors)
+            ))
+        return list(Recipe.objects.filter(id__gt=last_id).values_list(
+            'id', flat=True
+        ))
+
+    def create_recipe_relations(self, recipe_ids):
+        tag_ids = [
+            Tag.objects.get_or_create(
+                slug=slug, defaults={'name': name, 'color': color}
+            )[0].id
+            for name, color, slug in TAGS
+        ]
+        ingredient_ids = list(
+            Ingredient.objects.values_list('id', flat=True)
+        )
+        mean = self.options['ingredients_per_recipe']
+        self.insert(IngredientsAmount, (
+            IngredientsAmount(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_id,
+                amount=self.random.randint(1, 500),
+            )
+            for recipe_id in recipe_ids
+            for ingredient_id in self.random.sample(
+                ingredient_ids,
+                min(max(1, self.count(mean)), len(ingredient_ids))
+            )
+        ))
+        self.insert(Recipe.tags.through, (
+            Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in self.random.sample(
+                tag_ids, self.random.randint(1, 3)
+            )
+        ))
+
+    def create_subscriptions(self, user_ids):
+        """Подписчики распределены по степенному закону."""
+        popularity = self.power_law(len(user_ids))
+        self.insert(Subscribe, (
+            Subscribe(user_id=user_id, author_id=author_id)
+            for user_id in user_ids
+            for author_id in self.sample(
+                user_ids, popularity, self.count(self.options['follows'])
+            )
+            if author_id != user_id
+        ))
+
+    def create_user_recipes(self, user_ids, recipe_ids):
+        """Избранное и корзины, часть корзин очень большие."""
+        popularity = self.power_law(len(recipe_ids))
+        self.insert(Favorite, (
+            Favorite(user_id=user_id, recipe_id=recipe_id)
+            for user_id in user_ids
+            for recipe_id in self.sample(
+                recipe_ids, popularity,
+                self.count(self.options['favorites'])
+            )
+        ))
+        self.insert(ShoppingCart, (
+            ShoppingCart(user_id=user_id, recipe_id=recipe_id)
+            for user_id in user_ids
+            for recipe_id in self.sample(
+                recipe_ids, popularity,
+                self.random.randint(*BIG_CART_SIZE)
+                if self.random.random() < self.options['big_carts']
+                else self.count(self.options['cart'])
+            )
+        ))
+
+    def create_feed(self, user_ids):
+        """Ленты подписчиков без рецептов плодовитых авторов,
+        которые добавляются в ленту при чтении."""
+        recipes = defaultdict(list)
+        for author_id, recipe_id, pub_date in Recipe.objects.filter(
+            author__in=user_ids,
+            author__recipes_count__lte=settings.FEED_MAX_AUTHOR_RECIPES
+        ).values_list('author_id', 'id', 'pub_date'):
+            recipes[author_id].append((recipe_id, pub_date))
+        self.insert(FeedItem, (
+            FeedItem(user_id=user_id, recipe_id=recipe_id, pub_date=pub_date)
+            for user_id, author_id in Subscribe.objects.filter(
+                user__in=user_ids
+            ).values_list('user_id', 'author_id').iterator()
+            for recipe_id, pub_date in recipes[author_id]
+        ))
@@ -1,19 +1,104 @@
+import csv
 import json
+import os
+import time
+from itertools import islice
 
-from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.cache import INGREDIENTS, touch
 from recipes.models import Ingredient
 
+CHUNK_SIZE = 64 * 1024
+
+
+def iter_json(file):
+    """Читаем массив объектов json по частям, не загружая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = file.read(CHUNK_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('Ожидается массив json')
+    buffer = buffer[1:]
+    while True:
+        buffer = buffer.lstrip().lstrip(',').lstrip()
+        if buffer.startswith(']'):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except ValueError:
+            chunk = file.read(CHUNK_SIZE)
+            if not chunk:
+                raise CommandError('Файл json обрывается')
+            buffer += chunk
+            continue
+        yield item
+        buffer = buffer[end:]
+
+
+def iter_csv(file):
+    """Читаем строки csv вида "название,единица измерения"."""
+    for name, measurement_unit in csv.reader(file):
+        yield {'name': name, 'measurement_unit': measurement_unit}
+
+
+READERS = {
+    '.json': iter_json,
+    '.csv': iter_csv,
+}
+
 
 class Command(BaseCommand):
-    """Загрузка списка игредиентов из json файла."""
-    help = 'Loads data from ingredients.json'
+    """Загрузка списка игредиентов из json или csv файла."""
+    help = 'Loads ingredients from a json or csv file'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            default=os.path.join(
+                settings.BASE_DIR, 'data', 'ingredients.json'
+            ),
+            help='Путь к файлу json или csv'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Количество ингредиентов в одном запросе'
+        )
 
     def handle(self, *args, **options):
-        self.stdout.write(self.style.WARNING('Start'))
-        with open('data/ingredients.json', encoding='utf-8',
-                  ) as data_file_ingredients:
-            ingredient_data = json.loads(data_file_ingredients.read())
-            for ingredients in ingredient_data:
-                Ingredient.objects.get_or_create(**ingredients)
-
-        self.stdout.write(self.style.SUCCESS('Done'))
+        path = options['path']
+        reader = READERS.get(os.path.splitext(path)[1].lower())
+        if reader is None:
+            raise CommandError('Поддерживаются только файлы json и csv')
+        self.stdout.write(self.style.WARNING(f'Start loading {path}'))
+        count_before = Ingredient.objects.count()
+        started = time.monotonic()
+        processed = 0
+        with open(path, encoding='utf-8') as file, transaction.atomic():
+            rows = reader(file)
+            while True:
+                batch = [
+                    Ingredient(
+                        name=row['name'],
+                        measurement_unit=row['measurement_unit']
+                    )
+                    for row in islice(rows, options['batch_size'])
+                ]
+                if not batch:
+                    break
+                Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+                processed += len(batch)
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f'Processed {processed} rows '
+                    f'({processed / max(elapsed, 1e-6):.0f} rows/s)'
+                )
+        touch(INGREDIENTS)
+        created = Ingredient.objects.count() - count_before
+        self.stdout.write(self.style.SUCCESS(
+            f'Done: {processed} rows, {created} new ingredients '
+            f'in {time.monotonic() - started:.2f}s'
+        ))
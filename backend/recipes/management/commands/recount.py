@@ -0,0 +1,39 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Subscribe
+
+User = get_user_model()
+
+
+def count_related(model, field):
+    """Подзапрос количества связанных объектов."""
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+            field
+        ).annotate(count=Count('pk')).values('count'),
+        output_field=IntegerField()
+    ), 0)
+
+
+class Command(BaseCommand):
+    """Пересчёт счётчиков рецептов и пользователей."""
+    help = 'Recomputes favorites, carts, recipes and followers counters'
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.update(
+            favorites_count=count_related(Favorite, 'recipe'),
+            in_carts_count=count_related(ShoppingCart, 'recipe'),
+        )
+        users = User.objects.update(
+            recipes_count=count_related(Recipe, 'author'),
+            followers_count=count_related(Subscribe, 'author'),
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Recounted {recipes} recipes and {users} users'
+        ))
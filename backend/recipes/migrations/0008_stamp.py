@@ -0,0 +1,25 @@
+# Generated by Django 2.2.16 on 2026-10-18 06:35
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_feeditem'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Stamp',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False, verbose_name='Набор данных')),
+                ('modified', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Изменён')),
+            ],
+            options={
+                'verbose_name': 'Метка изменения',
+                'verbose_name_plural': 'Метки изменений',
+            },
+        ),
+    ]
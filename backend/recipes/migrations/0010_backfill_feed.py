@@ -0,0 +1,45 @@
+from collections import defaultdict
+from itertools import islice
+
+from django.conf import settings
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+
+def backfill_feed(apps, schema_editor):
+    """Заполняем ленты по уже существующим подпискам.
+    Рецепты плодовитых авторов добавляются в ленту при чтении."""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    FeedItem = apps.get_model('recipes', 'FeedItem')
+    Subscribe = apps.get_model('users', 'Subscribe')
+    threshold = settings.FEED_MAX_AUTHOR_RECIPES
+    recipes = defaultdict(list)
+    for author_id, recipe_id, pub_date in Recipe.objects.filter(
+        author__recipes_count__lte=threshold
+    ).values_list('author_id', 'id', 'pub_date').iterator():
+        recipes[author_id].append((recipe_id, pub_date))
+    items = (
+        FeedItem(user_id=user_id, recipe_id=recipe_id, pub_date=pub_date)
+        for user_id, author_id in Subscribe.objects.values_list(
+            'user_id', 'author_id'
+        ).iterator()
+        for recipe_id, pub_date in recipes[author_id]
+    )
+    while True:
+        batch = list(islice(items, BATCH_SIZE))
+        if not batch:
+            break
+        FeedItem.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_fill_counters'),
+        ('users', '0002_user_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_feed, migrations.RunPython.noop),
+    ]
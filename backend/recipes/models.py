@@ -1,7 +1,10 @@
 from django.contrib.auth import get_user_model
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
-from django.db.models import UniqueConstraint
+from django.db.models import F, UniqueConstraint
+from django.utils import timezone
+
+from foodgram.counters import CountersMixin
 
 User = get_user_model()
 
@@ -53,7 +56,7 @@ class Ingredient(models.Model):
         return f'{self.name} {self.measurement_unit}'
 
 
-class Recipe(models.Model):
+class Recipe(CountersMixin, models.Model):
     """Модель рецептов."""
     author = models.ForeignKey(
         User,
@@ -107,15 +110,58 @@ class Recipe(models.Model):
         auto_now_add=True,
         db_index=True
     )
+    has_image_variants = models.BooleanField(
+        'Есть уменьшенные изображения',
+        default=False,
+        editable=False
+    )
+    version = models.PositiveIntegerField(
+        'Версия',
+        default=0,
+        editable=False
+    )
+    favorites_count = models.PositiveIntegerField(
+        'Добавлен в избранное',
+        default=0,
+        editable=False
+    )
+    in_carts_count = models.PositiveIntegerField(
+        'Добавлен в корзину',
+        default=0,
+        editable=False
+    )
+
+    counter_fields = ('favorites_count', 'in_carts_count')
+    update_only_fields = ('version', 'has_image_variants')
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
-        ordering = ('-pub_date',)
+        ordering = ('-pub_date', 'id')
+        indexes = (
+            models.Index(
+                fields=('-pub_date', 'id'), name='recipe_pub_date_id_idx'
+            ),
+        )
 
     def __str__(self):
         return f'{self.name}'
 
+    def save(self, *args, **kwargs):
+        """Увеличиваем версию рецепта при каждом сохранении.
+        Версия увеличивается в базе, так как её меняет и фоновая
+        обработка изображений."""
+        if self._state.adding:
+            self.version += 1
+            return super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            update_fields = self.get_saved_fields()
+        kwargs['update_fields'] = {*update_fields, 'version'}
+        self.version = F('version') + 1
+        super().save(*args, **kwargs)
+        self.refresh_from_db(fields=('version',))
+
 
 class IngredientsAmount(models.Model):
     """Модель для количества ингредиентов в рецепте."""
@@ -220,3 +266,54 @@ class ShoppingCart(models.Model):
             f'Рецепт {self.recipe} добавлен в корзину '
             f'пользователем {self.user}'
         )
+
+
+class FeedItem(models.Model):
+    """Запись ленты подписок пользователя.
+    Дата публикации копируется из рецепта, чтобы листать ленту
+    по индексу без соединения с рецептами."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed',
+        verbose_name='Пользователь',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_items',
+        verbose_name='Рецепт',
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Лента'
+        constraints = [
+            UniqueConstraint(fields=['user', 'recipe'],
+                             name='unique_feed_item')
+        ]
+        indexes = (
+            models.Index(
+                fields=('user', '-pub_date', 'recipe'),
+                name='feed_user_pub_date_idx'
+            ),
+        )
+
+    def __str__(self):
+        return f'Рецепт {self.recipe} в ленте пользователя {self.user}'
+
+
+class Stamp(models.Model):
+    """Метка последнего изменения набора данных.
+    Хранится в базе, чтобы изменения из любого процесса
+    были видны всем процессам."""
+    name = models.CharField('Набор данных', max_length=50, primary_key=True)
+    modified = models.DateTimeField('Изменён', default=timezone.now)
+
+    class Meta:
+        verbose_name = 'Метка изменения'
+        verbose_name_plural = 'Метки изменений'
+
+    def __str__(self):
+        return self.name